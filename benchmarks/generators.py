@@ -0,0 +1,79 @@
+"""
+Генераторы синтетических праволинейных грамматик для бенчмарков. Каждый возвращает текст грамматики
+в формате RGrammar.fromstring, поэтому разбор тоже попадает в измерения
+"""
+from __future__ import annotations
+
+import random
+
+
+def nterm(idx: int) -> str:
+    return f'X{idx}'
+
+
+def random_grammar(n_nterms: int,
+                   fan_out: int = 2,
+                   chain_length: int = 1,
+                   ambiguity: float = 0.0,
+                   alphabet: str = 'ab',
+                   final_ratio: float = 0.2,
+                   seed: int = 0) -> str:
+    """
+    n_nterms нетерминалов по fan_out альтернатив у каждого; альтернатива -- chain_length терминалов
+    и случайный нетерминал (с вероятностью final_ratio -- без нетерминала).
+    ambiguity -- доля альтернатив, повторяющих терминалы первой альтернативы: такие альтернативы
+    начинаются одинаково и ведут в разные нетерминалы, то есть делают автомат недетерминированным
+    """
+    r = random.Random(seed)
+    lines = []
+    for idx in range(n_nterms):
+        first = ' '.join(r.choice(alphabet) for _ in range(chain_length))
+        variants = []
+        for variant_idx in range(fan_out):
+            if variant_idx > 0 and r.random() < ambiguity:
+                terms = first
+            else:
+                terms = ' '.join(r.choice(alphabet) for _ in range(chain_length))
+            if r.random() < final_ratio:
+                variants.append(terms or 'ε')
+            else:
+                variants.append(f'{terms} {nterm(r.randrange(n_nterms))}'.strip())
+        lines.append(f'{nterm(idx)} -> ' + ' | '.join(variants))
+    return '\n'.join(lines)
+
+
+def chain_grammar(length: int, alphabet: str = 'ab') -> str:
+    """
+    X0 -> a X1 | b, X1 -> a X2 | b, ...: длинная цепочка без циклов
+    """
+    lines = [f'{nterm(idx)} -> {alphabet[0]} {nterm(idx + 1)} | {alphabet[1]}' for idx in range(length)]
+    lines.append(f'{nterm(length)} -> {alphabet[1]}')
+    return '\n'.join(lines)
+
+
+def strongly_connected_grammar(n_nterms: int, alphabet: str = 'abc') -> str:
+    """
+    Все нетерминалы в одной компоненте сильной связности: худший случай для исключения переменных
+    """
+    a, b, c = alphabet[:3]
+    return '\n'.join(f'{nterm(idx)} -> {a} {nterm((idx + 1) % n_nterms)} | {b} {nterm((idx * 7) % n_nterms)} | '
+                     f'{c} {nterm((idx * 3 + 1) % n_nterms)} | {c}'
+                     for idx in range(n_nterms))
+
+
+def kth_from_end_grammar(k: int) -> str:
+    """
+    (a|b)*a(a|b)^k: минимальный ДКА имеет 2^(k+1) состояний
+    """
+    if k == 0:
+        return 'S -> a S | b S | a'
+    lines = [f'S -> a S | b S | a {nterm(1)}']
+    for idx in range(1, k):
+        lines.append(f'{nterm(idx)} -> a {nterm(idx + 1)} | b {nterm(idx + 1)}')
+    lines.append(f'{nterm(k)} -> a | b')
+    return '\n'.join(lines)
+
+
+def random_chains(count: int, length: int, alphabet: str = 'ab', seed: int = 0) -> list[str]:
+    r = random.Random(seed)
+    return [''.join(r.choice(alphabet) for _ in range(length)) for _ in range(count)]
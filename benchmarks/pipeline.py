@@ -0,0 +1,249 @@
+"""
+Бенчмарк конвейера грамматика -> уравнения -> регулярное выражение -> автомат -> проверка строк.
+Каждый этап измеряется отдельно: время (лучшее из нескольких прогонов) и пик выделенной памяти (tracemalloc,
+отдельным прогоном, чтобы трассировка не искажала время). Результаты пишутся в JSON и сравниваются между запусками:
+
+    python -m benchmarks.pipeline run --out before.json
+    python -m benchmarks.pipeline compare before.json after.json
+"""
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from benchmarks.generators import (chain_grammar, kth_from_end_grammar, random_chains, random_grammar,
+                                   strongly_connected_grammar)
+from eq_solver import ExpressionSizeError
+from main import FSM, fsm_from_grammar, fsm_from_item
+from model.rgrammar import RGrammar
+from regex_solver import RegexEquation, regex_solve
+from simplifier import simplify
+
+
+@dataclass
+class Case:
+    name: str
+    make_grammar: Callable[..., str]
+    params: dict[str, Any] = field(default_factory=dict)
+    alphabet: str = 'ab'
+    chain_count: int = 200
+    chain_length: int = 100
+
+
+CASES: list[Case] = [
+    Case('chain_200', chain_grammar, {'length': 200}),
+    Case('chain_500', chain_grammar, {'length': 500}),
+    Case('scc_10', strongly_connected_grammar, {'n_nterms': 10}, alphabet='abc'),
+    Case('scc_15', strongly_connected_grammar, {'n_nterms': 15}, alphabet='abc'),
+    Case('random_n50_f2', random_grammar, {'n_nterms': 50, 'fan_out': 2}),
+    Case('random_n50_f3_c2_amb50', random_grammar,
+         {'n_nterms': 50, 'fan_out': 3, 'chain_length': 2, 'ambiguity': 0.5}),
+    Case('random_n100_f2_amb30', random_grammar, {'n_nterms': 100, 'fan_out': 2, 'ambiguity': 0.3}),
+    Case('kth_from_end_4', kth_from_end_grammar, {'k': 4}),
+    Case('kth_from_end_8', kth_from_end_grammar, {'k': 8}),
+    Case('kth_from_end_12', kth_from_end_grammar, {'k': 12}),
+]
+
+# Автомат Томпсона строится по дереву выражения, а не по общему графу узлов: выражение больше этого
+# размера не строим, а записываем ошибку этапа
+MAX_FSM_ITEM_SIZE = 1_000_000
+
+
+def _fromstring(ctx: dict) -> None:
+    ctx['grammar'] = RGrammar.fromstring(ctx['text'])
+
+
+def _expr_from_grammar(ctx: dict) -> None:
+    ctx['eqs'] = RegexEquation.expr_from_grammar(ctx['grammar'])
+
+
+def _regex_solve(ctx: dict) -> None:
+    eqs = regex_solve(ctx['eqs'])
+    ctx['regex'] = [eq for eq in eqs if eq.X.sym == ctx['grammar'].start][0].calculate_result()
+
+
+def _simplify(ctx: dict) -> None:
+    ctx['regex'], _ = simplify(ctx['regex'])
+
+
+def _fsm_from_item(ctx: dict) -> None:
+    if ctx['regex'].size > MAX_FSM_ITEM_SIZE:
+        raise ExpressionSizeError(f'Regex tree has {ctx["regex"].size} nodes, limit is {MAX_FSM_ITEM_SIZE}')
+    ctx['fsm'] = FSM('start', fsm_from_item(ctx['regex']))
+
+
+def _apply(ctx: dict) -> None:
+    ctx['accepted'] = sum(ctx['fsm'].apply(chain)[0] for chain in ctx['chains'])
+
+
+def _fsm_from_grammar(ctx: dict) -> None:
+    ctx['direct_fsm'] = fsm_from_grammar(ctx['grammar'])
+
+
+def _apply_direct(ctx: dict) -> None:
+    ctx['accepted_direct'] = sum(ctx['direct_fsm'].apply(chain)[0] for chain in ctx['chains'])
+
+
+STAGES: list[tuple[str, Callable[[dict], None]]] = [
+    ('fromstring', _fromstring),
+    ('expr_from_grammar', _expr_from_grammar),
+    ('regex_solve', _regex_solve),
+    ('simplify', _simplify),
+    ('fsm_from_item', _fsm_from_item),
+    ('apply', _apply),
+    ('fsm_from_grammar', _fsm_from_grammar),
+    ('apply_direct', _apply_direct),
+]
+
+# Этапы маршрута через регулярное выражение: если решение упало, они пропускаются, а прямой маршрут -- нет
+REGEX_ROUTE = {'expr_from_grammar', 'regex_solve', 'simplify', 'fsm_from_item', 'apply'}
+
+
+def _context(case: Case) -> dict:
+    return {
+        'text': case.make_grammar(**case.params),
+        'chains': random_chains(case.chain_count, case.chain_length, case.alphabet),
+    }
+
+
+def _run_pass(case: Case, memory: bool) -> tuple[dict[str, float], dict[str, Optional[str]], dict]:
+    """
+    Один прогон всех этапов на свежем контексте. Узлы выражений интернированы слабыми ссылками,
+    поэтому после сборки мусора предыдущий прогон не оставляет готовых узлов следующему
+    """
+    gc.collect()
+    ctx = _context(case)
+    measured: dict[str, float] = {}
+    errors: dict[str, Optional[str]] = {}
+    for name, stage in STAGES:
+        if name in REGEX_ROUTE and any(errors.get(other) for other in REGEX_ROUTE):
+            continue
+        if memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            stage(ctx)
+            errors[name] = None
+        except (ExpressionSizeError, RecursionError, MemoryError) as e:
+            errors[name] = f'{type(e).__name__}: {e}'
+        finally:
+            elapsed = time.perf_counter() - start
+            if memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                measured[name] = peak
+            else:
+                measured[name] = elapsed
+    return measured, errors, ctx
+
+
+def run_case(case: Case, repeat: int = 1, memory: bool = True) -> dict:
+    seconds: dict[str, float] = {}
+    errors: dict[str, Optional[str]] = {}
+    ctx: dict = {}
+    for _ in range(repeat):
+        measured, errors, ctx = _run_pass(case, memory=False)
+        for name, value in measured.items():
+            seconds[name] = min(seconds.get(name, value), value)
+    peaks = _run_pass(case, memory=True)[0] if memory else {}
+
+    stages = {}
+    for name, _ in STAGES:
+        if name not in seconds:
+            continue
+        stages[name] = {'seconds': seconds[name], 'peak_bytes': peaks.get(name), 'error': errors.get(name)}
+    stats = {
+        'productions': len(ctx['grammar'].productions) if 'grammar' in ctx else None,
+        'regex_size': ctx['regex'].size if 'regex' in ctx else None,
+        'fsm_states': len(ctx['fsm'].states) if 'fsm' in ctx else None,
+        'direct_fsm_states': len(ctx['direct_fsm'].states) if 'direct_fsm' in ctx else None,
+        'accepted': ctx.get('accepted_direct'),
+    }
+    return {'params': case.params, 'stages': stages, 'stats': stats}
+
+
+def run(cases: list[Case], repeat: int = 1, memory: bool = True, log: Callable[[str], None] = print) -> dict:
+    results = {}
+    for case in cases:
+        results[case.name] = run_case(case, repeat, memory)
+        total = sum(stage['seconds'] for stage in results[case.name]['stages'].values())
+        log(f'{case.name}: {total:.3f} s')
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'repeat': repeat,
+        },
+        'cases': results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = 1.2) -> tuple[list[str], bool]:
+    """
+    Построчное сравнение двух файлов результатов. Этап считается регрессией, если время выросло
+    больше чем в threshold раз
+    """
+    lines = [f'{"case":<28} {"stage":<18} {"old, s":>10} {"new, s":>10} {"ratio":>7}']
+    regressed = False
+    for case, result in new['cases'].items():
+        if case not in old['cases']:
+            continue
+        old_stages = old['cases'][case]['stages']
+        for stage, values in result['stages'].items():
+            if stage not in old_stages:
+                continue
+            before, after = old_stages[stage]['seconds'], values['seconds']
+            ratio = after / before if before > 0 else float('inf')
+            mark = ''
+            if ratio > threshold:
+                regressed = True
+                mark = ' !'
+            lines.append(f'{case:<28} {stage:<18} {before:>10.4f} {after:>10.4f} {ratio:>7.2f}{mark}')
+    return lines, regressed
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Pipeline benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--out', default='bench_results.json')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--no-memory', action='store_true')
+    run_parser.add_argument('--case', default='*', help='glob over case names')
+
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=1.2)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        cases = [case for case in CASES if fnmatch.fnmatch(case.name, args.case)]
+        results = run(cases, args.repeat, not args.no_memory)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        return 0
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    lines, regressed = compare(old, new, args.threshold)
+    print('\n'.join(lines))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import sys
+from array import array
+from collections import deque
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from dfa import CompiledDFA
+
+if TYPE_CHECKING:
+    from main import FSM
+
+EPSILON_SYMBOL_ID = -1
+
+
+class CompactFSM:
+    """
+    Неизменяемое компактное представление ε-НКА.
+    Состояния -- целые числа, рёбра хранятся в CSR-раскладке: рёбра состояния i лежат
+    в rib_symbols/rib_targets на отрезке [offsets[i], offsets[i + 1]).
+    Имена состояний лежат в отдельной таблице и нужны только для отображения
+    """
+    __slots__ = ('names', 'symbols', 'start_state', 'offsets', 'rib_symbols', 'rib_targets', 'final',
+                 '_closures', '_moves', '_symbol_ids', '_dfa')
+
+    names: tuple[str, ...]
+    symbols: tuple[str, ...]
+    start_state: int
+    offsets: array
+    rib_symbols: array
+    rib_targets: array
+    final: bytes
+    # Производные структуры строятся при первом обращении и дальше переиспользуются
+    _closures: Optional[tuple[tuple[int, ...], ...]]
+    _moves: Optional[dict[int, dict[str, list[int]]]]
+    _symbol_ids: dict[str, int]
+    _dfa: Optional[CompiledDFA]
+
+    def __init__(self,
+                 names: tuple[str, ...],
+                 symbols: tuple[str, ...],
+                 start_state: int,
+                 offsets: array,
+                 rib_symbols: array,
+                 rib_targets: array,
+                 final: bytes):
+        if len(offsets) != len(names) + 1 or len(final) != len(names):
+            raise RuntimeError(f'Inconsistent compact FSM: {len(names)} states, '
+                               f'{len(offsets)} offsets, {len(final)} final flags')
+        if len(rib_symbols) != len(rib_targets) or offsets[-1] != len(rib_targets):
+            raise RuntimeError(f'Inconsistent compact FSM: {offsets[-1]} ribs declared, '
+                               f'{len(rib_symbols)} symbols and {len(rib_targets)} targets stored')
+        for name, value in (('names', names),
+                            ('symbols', symbols),
+                            ('start_state', start_state),
+                            ('offsets', offsets),
+                            ('rib_symbols', rib_symbols),
+                            ('rib_targets', rib_targets),
+                            ('final', final),
+                            ('_closures', None),
+                            ('_moves', None),
+                            ('_symbol_ids', {symbol: idx for idx, symbol in enumerate(symbols)}),
+                            ('_dfa', None)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    @classmethod
+    def from_fsm(cls, fsm: FSM) -> CompactFSM:
+        names = tuple(fsm.states.keys())
+        ids = {name: idx for idx, name in enumerate(names)}
+        symbol_ids: dict[str, int] = {}
+        offsets = array('I', [0])
+        rib_symbols = array('i')
+        rib_targets = array('I')
+        final = bytearray()
+        for name in names:
+            for rib in fsm.states[name].ribs:
+                if rib.symbol is None:
+                    rib_symbols.append(EPSILON_SYMBOL_ID)
+                else:
+                    rib_symbols.append(symbol_ids.setdefault(rib.symbol, len(symbol_ids)))
+                rib_targets.append(ids[rib.state_name])
+            offsets.append(len(rib_targets))
+            final.append(fsm.is_final(name))
+        return CompactFSM(names, tuple(symbol_ids.keys()), ids[fsm.start_state],
+                          offsets, rib_symbols, rib_targets, bytes(final))
+
+    @property
+    def states_count(self) -> int:
+        return len(self.names)
+
+    @property
+    def ribs_count(self) -> int:
+        return len(self.rib_targets)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Память под структуру автомата без таблицы имён
+        """
+        return (sys.getsizeof(self.offsets) + sys.getsizeof(self.rib_symbols) +
+                sys.getsizeof(self.rib_targets) + sys.getsizeof(self.final) +
+                sys.getsizeof(self.symbols) + sum(map(sys.getsizeof, self.symbols)))
+
+    def state_name(self, state: int) -> str:
+        return self.names[state]
+
+    def ribs(self, state: int) -> Iterator[tuple[Optional[str], int]]:
+        for idx in range(self.offsets[state], self.offsets[state + 1]):
+            symbol = self.rib_symbols[idx]
+            yield (None if symbol == EPSILON_SYMBOL_ID else self.symbols[symbol]), self.rib_targets[idx]
+
+    def is_final(self, state: int) -> bool:
+        return self.final[state] != 0
+
+    def epsilon_closures(self) -> tuple[tuple[int, ...], ...]:
+        """
+        То же, что FSM.epsilon_closures, но без путей: только значимые состояния, достижимые по ε-рёбрам
+        """
+        if self._closures is None:
+            offsets, rib_symbols, rib_targets = self.offsets, self.rib_symbols, self.rib_targets
+            significant = [self.final[state] != 0 or
+                           any(rib_symbols[idx] != EPSILON_SYMBOL_ID for idx in range(offsets[state], offsets[state + 1]))
+                           for state in range(self.states_count)]
+            closures = []
+            for state in range(self.states_count):
+                seen = {state}
+                closure = []
+                queue = deque([state])
+                while queue:
+                    current = queue.popleft()
+                    if significant[current]:
+                        closure.append(current)
+                    for idx in range(offsets[current], offsets[current + 1]):
+                        if rib_symbols[idx] == EPSILON_SYMBOL_ID and rib_targets[idx] not in seen:
+                            seen.add(rib_targets[idx])
+                            queue.append(rib_targets[idx])
+                closures.append(tuple(closure))
+            object.__setattr__(self, '_closures', tuple(closures))
+        return self._closures
+
+    def symbol_moves(self) -> dict[int, dict[str, list[int]]]:
+        """
+        Переходы по символам в виде словарей, как у FSM. Нужны только для построения ДКА
+        """
+        if self._moves is None:
+            moves = {}
+            for state in range(self.states_count):
+                by_symbol: dict[str, list[int]] = {}
+                for idx in range(self.offsets[state], self.offsets[state + 1]):
+                    symbol = self.rib_symbols[idx]
+                    if symbol != EPSILON_SYMBOL_ID:
+                        by_symbol.setdefault(self.symbols[symbol], []).append(self.rib_targets[idx])
+                moves[state] = by_symbol
+            object.__setattr__(self, '_moves', moves)
+        return self._moves
+
+    def match(self, chain: str) -> bool:
+        closures = self.epsilon_closures()
+        offsets, rib_symbols, rib_targets = self.offsets, self.rib_symbols, self.rib_targets
+        symbol_ids = self._symbol_ids
+        active = set(closures[self.start_state])
+        for symbol in chain:
+            symbol_id = symbol_ids.get(symbol)
+            if symbol_id is None:
+                return False
+            reached = set()
+            for state in active:
+                for idx in range(offsets[state], offsets[state + 1]):
+                    if rib_symbols[idx] == symbol_id:
+                        reached.update(closures[rib_targets[idx]])
+            if len(reached) == 0:
+                return False
+            active = reached
+        return any(self.final[state] for state in active)
+
+    def to_dfa(self) -> CompiledDFA:
+        if self._dfa is None:
+            dfa, _ = CompiledDFA.from_fsm(self).minimize()
+            object.__setattr__(self, '_dfa', dfa)
+        return self._dfa
+
+    def __repr__(self) -> str:
+        return f'CompactFSM(states={self.states_count}, ribs={self.ribs_count})'
@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+import metrics
+from stream import ChunkMatcher
+
+if TYPE_CHECKING:
+    from compact_fsm import CompactFSM
+    from main import FSM
+
+DEAD_STATE = 0
+START_STATE = 1
+OTHER_CLASS = 0
+MATCH_BATCH_SIZE = 1 << 16
+
+
+@dataclass(frozen=True)
+class MinimizationReport:
+    states_before: int
+    states_after: int
+
+    def __repr__(self) -> str:
+        return f'MinimizationReport({self.states_before} -> {self.states_after} states)'
+
+
+class CompiledDFA:
+    """
+    Детерминированный автомат с целочисленными состояниями.
+    Состояние 0 -- мёртвое, 1 -- стартовое; класс символа 0 -- любой символ вне алфавита
+    """
+    symbols: tuple[str, ...]
+    table: np.ndarray
+    accepting: np.ndarray
+
+    def __init__(self,
+                 symbols: Iterable[str],
+                 table: np.ndarray,
+                 accepting: np.ndarray,
+                 prefix: str = '',
+                 labels: Optional[Sequence[frozenset[int]]] = None):
+        self.symbols = tuple(symbols)
+        # Для общего автомата нескольких грамматик: номера грамматик, принимающих в каждом состоянии
+        self.labels = tuple(labels) if labels is not None else None
+        # Литерал, с которого обязано начинаться любое непустое вхождение; используется для пропуска текста при поиске
+        self.prefix = prefix
+        self.table = np.ascontiguousarray(table, dtype=np.int32)
+        self.accepting = np.ascontiguousarray(accepting, dtype=np.bool_)
+        if self.table.shape != (len(self.accepting), len(self.symbols) + 1):
+            raise RuntimeError(f'Transition table of shape {self.table.shape} does not match '
+                               f'{len(self.accepting)} states and {len(self.symbols)} symbols')
+        if self.labels is not None and len(self.labels) != len(self.accepting):
+            raise RuntimeError(f'Got {len(self.labels)} labels for {len(self.accepting)} states')
+        self.classes = {sym: idx + 1 for idx, sym in enumerate(self.symbols)}
+        # Для посимвольного матчинга списки быстрее, чем индексация numpy-скаляров
+        self._rows = self.table.tolist()
+        self._accepting = self.accepting.tolist()
+
+        single_chars = [sym for sym in self.symbols if len(sym) == 1]
+        # Последний элемент -- класс для всех кодов за пределами таблицы
+        self.codepoint_classes = np.zeros(max(map(ord, single_chars), default=0) + 2, dtype=np.int32)
+        for sym in single_chars:
+            self.codepoint_classes[ord(sym)] = self.classes[sym]
+        self.byte_classes = {ord(sym): self.classes[sym] for sym in single_chars if ord(sym) < 0x80}
+
+    @property
+    def states_count(self) -> int:
+        return len(self.accepting)
+
+    @classmethod
+    def from_fsm(cls, fsm: Union[FSM, CompactFSM], prefix: Optional[str] = None) -> CompiledDFA:
+        """
+        Построение подмножеств по ε-НКА.
+        Если prefix не передан, обязательный префикс для поиска выводится из самого автомата
+        """
+        symbols, rows, labels = cls._subset_construction([fsm])
+        accepting = [len(label) > 0 for label in labels]
+        dfa = CompiledDFA(symbols, np.array(rows, dtype=np.int32), np.array(accepting, dtype=np.bool_), prefix or '')
+        if prefix is None:
+            dfa.prefix = dfa._required_prefix()
+        return dfa
+
+    def _required_prefix(self) -> str:
+        """
+        Литерал, с которого начинается любое слово языка: путь от стартового состояния,
+        пока из состояния ведёт ровно один живой переход по одному символу и само оно не принимающее
+        """
+        symbols_by_class = {cls: sym for sym, cls in self.classes.items()}
+        prefix = ''
+        state = START_STATE
+        seen = set()
+        while state not in seen and not self._accepting[state]:
+            seen.add(state)
+            live = [(cls, target) for cls, target in enumerate(self._rows[state]) if target != DEAD_STATE]
+            if len(live) != 1 or live[0][0] == OTHER_CLASS or len(symbols_by_class[live[0][0]]) != 1:
+                break
+            prefix += symbols_by_class[live[0][0]]
+            state = live[0][1]
+        return prefix
+
+    @classmethod
+    def from_fsms(cls, fsms: Sequence[Union[FSM, CompactFSM]]) -> CompiledDFA:
+        """
+        Общий автомат для нескольких ε-НКА: каждое принимающее состояние помечено
+        множеством номеров автоматов (в порядке fsms), которые принимают строку
+        """
+        symbols, rows, labels = cls._subset_construction(fsms)
+        accepting = [len(label) > 0 for label in labels]
+        return CompiledDFA(symbols,
+                           np.array(rows, dtype=np.int32),
+                           np.array(accepting, dtype=np.bool_),
+                           labels=labels)
+
+    @staticmethod
+    def _subset_construction(fsms: Sequence[Union[FSM, CompactFSM]]
+                             ) -> tuple[list[str], list[list[int]], list[frozenset[int]]]:
+        """
+        Состояние ДКА -- множество пар (номер автомата, состояние автомата)
+        """
+        closures = [fsm.epsilon_closures() for fsm in fsms]
+        moves = [fsm.symbol_moves() for fsm in fsms]
+
+        symbols = []
+        for fsm_moves in moves:
+            for by_symbol in fsm_moves.values():
+                for sym in by_symbol.keys():
+                    if sym not in symbols:
+                        symbols.append(sym)
+
+        start = frozenset((idx, state) for idx, fsm in enumerate(fsms) for state in closures[idx][fsm.start_state])
+        ids: dict[frozenset, int] = {frozenset(): DEAD_STATE, start: START_STATE}
+        sets = [frozenset(), start]
+        rows = [[DEAD_STATE] * (len(symbols) + 1)]
+        idx = START_STATE
+        while idx < len(sets):
+            row = [DEAD_STATE]
+            for sym in symbols:
+                reached = set()
+                for fsm_idx, name in sets[idx]:
+                    fsm_closures = closures[fsm_idx]
+                    for target in moves[fsm_idx][name].get(sym, ()):
+                        reached.update((fsm_idx, state) for state in fsm_closures[target])
+                reached = frozenset(reached)
+                if reached not in ids:
+                    ids[reached] = len(sets)
+                    sets.append(reached)
+                row.append(ids[reached])
+            rows.append(row)
+            idx += 1
+
+        labels = [frozenset(fsm_idx for fsm_idx, name in s if fsms[fsm_idx].is_final(name)) for s in sets]
+        return symbols, rows, labels
+
+    def minimize(self) -> tuple[CompiledDFA, MinimizationReport]:
+        """
+        Минимизация алгоритмом Хопкрофта (уточнение разбиения).
+        Мёртвое и стартовое состояния сохраняют номера 0 и 1
+        """
+        states_count = self.states_count
+        classes_count = self.table.shape[1]
+        rows = self._rows
+
+        inverse: list[dict[int, list[int]]] = [{} for _ in range(classes_count)]
+        for state in range(states_count):
+            for cls, target in enumerate(rows[state]):
+                inverse[cls].setdefault(target, []).append(state)
+
+        groups: dict[Union[bool, frozenset[int]], set[int]] = {}
+        for state in range(states_count):
+            key = self.labels[state] if self.labels is not None else self._accepting[state]
+            groups.setdefault(key, set()).add(state)
+        blocks = list(groups.values())
+        block_of = [0] * states_count
+        for idx, block in enumerate(blocks):
+            for state in block:
+                block_of[state] = idx
+
+        largest = max(range(len(blocks)), key=lambda b: len(blocks[b]))
+        worklist = [idx for idx in range(len(blocks)) if idx != largest]
+        in_worklist = set(worklist)
+
+        while worklist:
+            splitter = worklist.pop()
+            in_worklist.discard(splitter)
+            splitter_states = list(blocks[splitter])
+            for cls in range(classes_count):
+                predecessors = set()
+                for target in splitter_states:
+                    predecessors.update(inverse[cls].get(target, ()))
+                touched: dict[int, set[int]] = {}
+                for state in predecessors:
+                    touched.setdefault(block_of[state], set()).add(state)
+                for idx, inside in touched.items():
+                    block = blocks[idx]
+                    if len(inside) == len(block):
+                        continue
+                    outside = block - inside
+                    blocks[idx] = inside
+                    new_idx = len(blocks)
+                    blocks.append(outside)
+                    for state in outside:
+                        block_of[state] = new_idx
+                    if idx in in_worklist:
+                        worklist.append(new_idx)
+                        in_worklist.add(new_idx)
+                    else:
+                        smaller = idx if len(inside) <= len(outside) else new_idx
+                        worklist.append(smaller)
+                        in_worklist.add(smaller)
+
+        new_ids = {block_of[DEAD_STATE]: DEAD_STATE}
+        order = [block_of[DEAD_STATE]]
+        if block_of[START_STATE] in new_ids:
+            # Пустой язык: стартовое состояние совпадает с мёртвым, но номер 1 должен существовать
+            order.append(block_of[DEAD_STATE])
+        else:
+            new_ids[block_of[START_STATE]] = START_STATE
+            order.append(block_of[START_STATE])
+        for state in range(states_count):
+            if block_of[state] not in new_ids:
+                new_ids[block_of[state]] = len(order)
+                order.append(block_of[state])
+
+        new_rows = []
+        accepting = []
+        for block in order:
+            representative = next(iter(blocks[block]))
+            new_rows.append([new_ids[block_of[target]] for target in rows[representative]])
+            accepting.append(self._accepting[representative])
+
+        labels = None
+        if self.labels is not None:
+            labels = [self.labels[next(iter(blocks[block]))] for block in order]
+        minimized = CompiledDFA(self.symbols,
+                                np.array(new_rows, dtype=np.int32),
+                                np.array(accepting, dtype=np.bool_),
+                                self.prefix,
+                                labels)
+        return minimized, MinimizationReport(states_count, minimized.states_count)
+
+    def symbol_class(self, symbol: str) -> int:
+        return self.classes.get(symbol, OTHER_CLASS)
+
+    def _final_state(self, chain: str) -> int:
+        rows = self._rows
+        classes = self.classes
+        state = START_STATE
+        for symbol in chain:
+            state = rows[state][classes.get(symbol, OTHER_CLASS)]
+            if state == DEAD_STATE:
+                break
+        return state
+
+    def _counted_final_state(self, chain: str) -> int:
+        """
+        _final_state со счётчиком шагов; вызывается, только когда метрики включены,
+        чтобы не замедлять основной цикл
+        """
+        rows = self._rows
+        classes = self.classes
+        state = START_STATE
+        steps = 0
+        for steps, symbol in enumerate(chain, 1):
+            state = rows[state][classes.get(symbol, OTHER_CLASS)]
+            if state == DEAD_STATE:
+                break
+        metrics.count('dfa.match.calls')
+        metrics.count('dfa.match.steps', steps)
+        return state
+
+    def match(self, chain: str) -> bool:
+        if metrics.enabled():
+            return self._accepting[self._counted_final_state(chain)]
+        return self._accepting[self._final_state(chain)]
+
+    def encode(self, chain: str) -> np.ndarray:
+        """
+        Строка -> массив классов символов
+        """
+        codepoints = np.frombuffer(chain.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        return self.codepoint_classes[np.minimum(codepoints, len(self.codepoint_classes) - 1)]
+
+    def final_states_many(self, chains: Sequence[str], batch_size: int = MATCH_BATCH_SIZE) -> np.ndarray:
+        """
+        Пакетный прогон строк: все строки пакета делают шаг по таблице переходов одновременно.
+        Строки сортируются по длине, поэтому на i-м шаге обрабатывается префикс пакета
+        из ещё не закончившихся строк, а столбец символов берётся прямо из общего буфера
+        без построения дополненной матрицы
+        """
+        chains = list(chains)
+        result = np.full(len(chains), START_STATE, dtype=np.int32)
+        if len(chains) == 0:
+            return result
+
+        lengths = np.fromiter(map(len, chains), dtype=np.int64, count=len(chains))
+        if metrics.enabled():
+            metrics.count('dfa.match.calls', len(chains))
+            metrics.count('dfa.match.steps', int(lengths.sum()))
+        starts = np.cumsum(lengths) - lengths
+        encoded = self.encode(''.join(chains))
+        order = np.argsort(-lengths, kind='stable')
+        flat_table = self.table.ravel()
+        classes_count = self.table.shape[1]
+        for batch_start in range(0, len(chains), batch_size):
+            batch = order[batch_start:batch_start + batch_size]
+            batch_lengths = lengths[batch]
+            batch_starts = starts[batch]
+
+            # Сколько строк пакета длиннее i символов (длины убывают)
+            active = np.searchsorted(-batch_lengths, -np.arange(batch_lengths[0]), side='left')
+            states = np.full(len(batch), START_STATE, dtype=np.int32)
+            for col, count in enumerate(active):
+                symbols = encoded[batch_starts[:count] + col]
+                states[:count] = flat_table[states[:count] * classes_count + symbols]
+            result[batch] = states
+        return result
+
+    def match_many(self, chains: Sequence[str], batch_size: int = MATCH_BATCH_SIZE) -> np.ndarray:
+        return self.accepting[self.final_states_many(chains, batch_size)]
+
+    def match_ids(self, chain: str) -> frozenset[int]:
+        """
+        Номера автоматов общего автомата (см. from_fsms), принимающих строку
+        """
+        return self._labels_of(self._final_state(chain))
+
+    def match_ids_many(self, chains: Sequence[str], batch_size: int = MATCH_BATCH_SIZE) -> list[frozenset[int]]:
+        return list(map(self._labels_of, self.final_states_many(chains, batch_size).tolist()))
+
+    def _labels_of(self, state: int) -> frozenset[int]:
+        if self.labels is None:
+            raise RuntimeError('Match ids are only available for automata built with CompiledDFA.from_fsms')
+        return self.labels[state]
+
+    def finditer(self, text: Union[str, bytes], pos: int = 0) -> Iterator[tuple[int, int]]:
+        """
+        Поиск всех непересекающихся вхождений языка в тексте, самое левое и самое длинное вхождение побеждает.
+        Текст читается за один проход: для каждого состояния ДКА хранится самая ранняя позиция, из которой в него пришли.
+        Пока ни одно вхождение не начато, текст пропускается до обязательного префикса через find,
+        а без префикса -- до первого символа, с которого вообще возможен переход.
+        В bytes сравниваются отдельные байты, поэтому там находятся только ASCII-символы алфавита
+        """
+        rows = self._rows
+        accepting = self._accepting
+        if isinstance(text, str):
+            classes = self.classes
+            prefix = self.prefix
+        else:
+            classes = self.byte_classes
+            prefix = self.prefix.encode()
+        start_row = rows[START_STATE]
+        start_accepting = accepting[START_STATE]
+        length = len(text)
+
+        # Состояние -> самая ранняя позиция начала, из которой оно достигнуто
+        threads: dict[int, int] = {}
+        best_start = best_end = -1
+        while True:
+            if len(threads) == 0 and best_start < 0:
+                if len(prefix) > 0:
+                    pos = text.find(prefix, pos)
+                    if pos < 0:
+                        return
+                elif not start_accepting:
+                    while pos < length and start_row[classes.get(text[pos], OTHER_CLASS)] == DEAD_STATE:
+                        pos += 1
+                    if pos == length:
+                        return
+            if best_start < 0:
+                threads.setdefault(START_STATE, pos)
+                if start_accepting and len(threads) == 1:
+                    best_start = best_end = pos
+
+            if pos < length:
+                cls = classes.get(text[pos], OTHER_CLASS)
+                pos += 1
+                stepped: dict[int, int] = {}
+                for state, start in threads.items():
+                    state = rows[state][cls]
+                    if state != DEAD_STATE and (state not in stepped or start < stepped[state]):
+                        stepped[state] = start
+                threads = stepped
+                for state, start in threads.items():
+                    if accepting[state] and (best_start < 0 or start < best_start or
+                                             (start == best_start and pos > best_end)):
+                        best_start, best_end = start, pos
+                if best_start >= 0:
+                    threads = {state: start for state, start in threads.items() if start <= best_start}
+            else:
+                threads = {}
+
+            if len(threads) == 0 and best_start >= 0:
+                yield best_start, best_end
+                pos = best_end if best_end > best_start else best_end + 1
+                best_start = best_end = -1
+            if pos > length or (len(threads) == 0 and pos == length and not start_accepting):
+                return
+
+    def search(self, text: Union[str, bytes], pos: int = 0) -> Optional[tuple[int, int]]:
+        return next(self.finditer(text, pos), None)
+
+    def count(self, text: Union[str, bytes], pos: int = 0) -> int:
+        return sum(1 for _ in self.finditer(text, pos))
+
+    def matcher(self) -> DFAMatcher:
+        return DFAMatcher(self)
+
+    def __repr__(self) -> str:
+        return f'CompiledDFA(states={self.states_count}, symbols={self.symbols})'
+
+
+class DFAMatcher(ChunkMatcher):
+    def __init__(self, dfa: CompiledDFA):
+        super().__init__()
+        self.dfa = dfa
+        self.state = START_STATE
+
+    @property
+    def alive(self) -> bool:
+        return self.state != DEAD_STATE
+
+    @property
+    def accepted(self) -> bool:
+        return self.dfa._accepting[self.state]
+
+    def _feed_text(self, text: str) -> None:
+        rows = self.dfa._rows
+        classes = self.dfa.classes
+        state = self.state
+        for symbol in text:
+            state = rows[state][classes.get(symbol, OTHER_CLASS)]
+            if state == DEAD_STATE:
+                break
+        self.state = state
@@ -1,10 +1,49 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Union
+from typing import Any, Callable, Generator, Iterable, Iterator, Optional, TypeVar, Union
+from weakref import WeakValueDictionary
+from zlib import crc32
+
+import metrics
+
+
+class ExpressionSizeError(ValueError):
+    pass
+
+
+@dataclass
+class NormalizationStats:
+    hits: int = 0
+    misses: int = 0
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+# Счётчики кэша нормализации (flatten/unfold_singles) для всех выражений
+normalization_stats = NormalizationStats()
+
+T = TypeVar('T')
+
+# Длина начала записи узла, по которому упорядочиваются слагаемые
+LABEL_LENGTH = 32
 
 
 class Item:
+    """
+    Узлы выражений неизменяемы и интернируются: структурно равные узлы -- один и тот же объект,
+    поэтому равенство -- сравнение по идентичности, а хэш вычисляется один раз при создании
+    """
+    __slots__ = ('_hash', '_size', '_digest', '_label', '_elems', '__weakref__')
+
+    @property
+    def size(self) -> int:
+        """
+        Число узлов дерева выражения, считается при создании узла
+        """
+        return self._size
 
     def replace(self, replace_what: Item, replace_with: Item) -> Item:
         if self == replace_what:
@@ -14,66 +53,133 @@ class Item:
     def depth(self) -> int:
         return 0
 
+    @property
+    def elems(self) -> frozenset[Elem]:
+        """
+        Все листья Elem выражения (в том числе внутри замыканий). Считается при создании узла
+        объединением множеств потомков, поэтому переменные уравнения проверяются за O(1)
+        """
+        return self._elems
+
     def has_item(self, what: Item) -> bool:
-        return self == what
+        if isinstance(what, Elem):
+            return what in self._elems
+        return any(node == what for node in walk(self))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __hash__(self):
+        return self._hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
 
-@dataclass(frozen=True)
 class Elem(Item):
+    __slots__ = ('sym',)
+    _interned: WeakValueDictionary = WeakValueDictionary()
+
     sym: Any
 
+    def __new__(cls, sym: Any):
+        node = cls._interned.get(sym)
+        if node is None:
+            node = object.__new__(cls)
+            object.__setattr__(node, 'sym', sym)
+            object.__setattr__(node, '_hash', hash((Elem, sym)))
+            object.__setattr__(node, '_size', 1)
+            object.__setattr__(node, '_digest', crc32(f'{type(sym).__name__}:{sym}'.encode()))
+            object.__setattr__(node, '_label', str(sym)[:LABEL_LENGTH])
+            object.__setattr__(node, '_elems', frozenset([node]))
+            cls._interned[sym] = node
+        return node
+
+    def __reduce__(self):
+        return Elem, (self.sym,)
+
     def __repr__(self) -> str:
         return str(self.sym)
 
-    def __eq__(self, other):
-        return isinstance(other, Elem) and self.sym == other.sym
-
 
-@dataclass
 class Closure(Item):
+    __slots__ = ('child',)
+    _interned: WeakValueDictionary = WeakValueDictionary()
+
     child: Item
 
-    def __init__(self, child: Item):
+    def __new__(cls, child: Item):
         while isinstance(child, Closure):
             # Сразу раскрываем замыкание, поскольку (a*)* => a*
             child = child.child
         while isinstance(child, Expr) and len(child.args) == 1:
             child = child.args[0]
-        self.child = child
+        node = cls._interned.get(child)
+        if node is None:
+            node = object.__new__(cls)
+            object.__setattr__(node, 'child', child)
+            object.__setattr__(node, '_hash', hash((Closure, child)))
+            object.__setattr__(node, '_size', 1 + child.size)
+            object.__setattr__(node, '_digest', _mix(crc32(b'*'), child._digest))
+            object.__setattr__(node, '_label', _repr_node(node, [child._label])[:LABEL_LENGTH])
+            object.__setattr__(node, '_elems', child._elems)
+            cls._interned[child] = node
+        return node
+
+    def __reduce__(self):
+        return Closure, (self.child,)
 
     def __repr__(self):
-        if isinstance(self.child, Expr):
-            if len(self.child.args) > 0:
-                return f'(({self.child})*)'
-            elif len(self.child.args) == 1:
-                return f'({self.child.args[0]}*)'
-        return f'{self.child}*'
+        return fold(self, _repr_node)
 
     def replace(self, replace_what: Item, replace_with: Item) -> Item:
         if self.child == replace_what:
             return Closure(replace_with)
         return self
 
-    def __eq__(self, other):
-        return isinstance(other, Closure) and self.child == other.child
-
 
-@dataclass(frozen=True)
 class Op:
+    __slots__ = ('sym', '__weakref__')
+    _interned: WeakValueDictionary = WeakValueDictionary()
+
     sym: Any
 
+    def __new__(cls, sym: Any):
+        node = cls._interned.get(sym)
+        if node is None:
+            node = object.__new__(cls)
+            object.__setattr__(node, 'sym', sym)
+            cls._interned[sym] = node
+        return node
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Op is immutable')
+
+    def __reduce__(self):
+        return Op, (self.sym,)
+
     def __repr__(self) -> str:
         if self.sym == '*':
             return '×'
         return str(self.sym)
 
 
-@dataclass
 class Expr(Item):
+    """
+    Сумма не зависит от порядка и повторов слагаемых, поэтому её ключ интернирования -- множество аргументов,
+    а сами слагаемые хранятся в каноническом порядке: Expr('+', [b, a]) -- это тот же узел a + b.
+    Произведение (конкатенация) упорядочено
+    """
+    __slots__ = ('op', 'args', '_normalized')
+    _interned: WeakValueDictionary = WeakValueDictionary()
+
     op: Op
-    args: list[Item]
+    args: tuple[Item, ...]
 
-    def __init__(self, op: Union[Op, str], args: list[Any]):
+    def __new__(cls, op: Union[Op, str], args: list[Any]):
         if isinstance(op, str):
             op = Op(op)
         real_args = []
@@ -83,30 +189,41 @@ class Expr(Item):
             real_args.append(arg)
 
         if op.sym == '+':
-            uniq_args = []
+            real_args = list(dict.fromkeys(real_args))
+            key = (op, frozenset(real_args))
+        else:
+            key = (op, tuple(real_args))
+
+        node = cls._interned.get(key)
+        if node is None:
+            if op.sym == '+':
+                # Порядок слагаемых не зависит от того, в каком порядке их передали при первом создании
+                real_args.sort(key=_order_key)
+            digest = crc32(str(op.sym).encode())
             for arg in real_args:
-                if isinstance(arg, Expr):
-                    uniq_args.append(arg)
-                elif arg not in uniq_args:
-                    uniq_args.append(arg)
-            real_args = uniq_args
-
-        self.op = op
-        self.args = real_args
-
-    def has_item(self, what: Item) -> bool:
-        for arg in self.args:
-            if arg.has_item(what):
-                return True
-        return False
+                digest = _mix(digest, arg._digest)
+            node = object.__new__(cls)
+            object.__setattr__(node, 'op', op)
+            object.__setattr__(node, 'args', tuple(real_args))
+            # (операция, distribute, budget) -> результат нормализации этого узла
+            object.__setattr__(node, '_normalized', None)
+            object.__setattr__(node, '_hash', hash(key))
+            object.__setattr__(node, '_size', 1 + sum(arg.size for arg in real_args))
+            object.__setattr__(node, '_digest', digest)
+            object.__setattr__(node, '_label', _repr_node(node, [arg._label for arg in real_args])[:LABEL_LENGTH])
+            object.__setattr__(node, '_elems', _merge_elems(real_args))
+            cls._interned[key] = node
+        return node
+
+    def __reduce__(self):
+        return Expr, (self.op, list(self.args))
 
     def extract(self, what: Item) -> tuple[Expr, list[Item]]:
         filtered_args = []
         extracted_args = []
-        for arg in self.flatten().args:
+        for arg in self.flatten(distribute=False).args:
             if isinstance(arg, Expr):
-                new_eq, extracted = arg.extract(what)
-                if len(extracted):
+                if _mentions(arg, what):
                     extracted_args.append(arg)
                 else:
                     filtered_args.append(arg)
@@ -116,52 +233,146 @@ class Expr(Item):
                 else:
                     extracted_args.append(arg)
 
-        return Expr(self.op, filtered_args).flatten(), extracted_args
+        return Expr(self.op, filtered_args).flatten(distribute=False), extracted_args
+
+    def expand(self, what: Item) -> Expr:
+        """
+        Раскрывает скобки только там, где встречается what, оставляя остальное в факторизованном виде:
+        a × (b × X + c × (d + e)) => a × b × X + a × c × (d + e).
+        В результате каждое слагаемое, содержащее what, -- произведение, оканчивающееся на what.
+        Как и в праволинейной грамматике, what может стоять только последним множителем
+        """
+        terms = []
+        for term, _ in trampoline(_expand_terms(self, what)):
+            if isinstance(term, Expr):
+                term = term.flatten(distribute=False)
+            terms.append(term)
+        return Expr('+', terms).flatten(distribute=False)
+
+    def split(self, what: Item, epsilon: Item) -> tuple[Item, Item]:
+        """
+        Представляет выражение в виде α × what + β без раскрытия скобок и возвращает (α, β).
+        Как и в expand, what может стоять только последним множителем. epsilon -- элемент пустого слова.
+        Каждый узел обрабатывается один раз, поэтому общие поддеревья не размножаются
+        """
+        empty = Expr('+', [])
+
+        def descend(node: Item) -> bool:
+            return isinstance(node, Expr) and node.has_item(what)
+
+        def split_node(node: Item, parts: list[tuple[Item, Item]]) -> tuple[Item, Item]:
+            if node == what:
+                return epsilon, empty
+            if not node.has_item(what):
+                return empty, node
+            if not isinstance(node, Expr):
+                raise ValueError(f'Unable to split {node} over {what}')
+            if node.op.sym == '+':
+                return Expr('+', [alpha for alpha, _ in parts]), Expr('+', [beta for _, beta in parts])
+            prefix = list(node.args[:-1])
+            if any(arg.has_item(what) for arg in prefix):
+                raise ValueError(f'Unable to split {node}: {what} is not the last factor')
+            alpha, beta = parts[-1]
+            return Expr('*', prefix + [alpha]), Expr('*', prefix + [beta])
+
+        alpha, beta = fold(self, split_node, descend)
+        return Expr('+', [alpha]).flatten(distribute=False), Expr('+', [beta]).flatten(distribute=False)
 
     def depth(self) -> int:
-        max_depth = 0
-        for arg in self.args:
-            max_depth = max(max_depth, arg.depth() + 1)
-        return max_depth
+        return fold(self, lambda node, depths: max((d + 1 for d in depths), default=0), _is_expr)
 
     def replace(self, replace_what: Item, replace_with: Item) -> Expr:
-        new_args = []
-        for arg in self.args:
-            arg = arg.replace(replace_what, replace_with)
-            if arg == replace_what:
-                arg = replace_with
-            new_args.append(arg)
-        return Expr(self.op, new_args)
-
-    def unfold_singles(self) -> Expr:
+        def descend(node: Item) -> bool:
+            # Поддеревья без заменяемого символа не перестраиваются
+            return isinstance(node, Expr) and (not isinstance(replace_what, Elem) or replace_what in node._elems)
+
+        def replace_node(node: Item, args: list[Item]) -> Item:
+            if not isinstance(node, Expr):
+                return node.replace(replace_what, replace_with)
+            if not descend(node):
+                return node
+            return Expr(node.op, [replace_with if arg == replace_what else arg for arg in args])
+        return fold(self, replace_node, descend)
+
+    def _cached(self, key: tuple) -> Optional[Expr]:
+        if self._normalized is not None:
+            result = self._normalized.get(key)
+            if result is not None:
+                normalization_stats.hits += 1
+                return result
+        normalization_stats.misses += 1
+        return None
+
+    def _store(self, key: tuple, result: Expr) -> Expr:
+        if self._normalized is None:
+            object.__setattr__(self, '_normalized', {})
+        self._normalized[key] = result
+        return result
+
+    def unfold_singles(self, distribute: bool = True, budget: Optional[int] = None) -> Expr:
+        return trampoline(self._normalize('unfold_singles', distribute, budget))
+
+    def flatten(self, distribute: bool = True, budget: Optional[int] = None) -> Expr:
+        """
+        Раскрывает вложенные операции одного типа.
+        При distribute=True произведение сумм раскрывается в сумму произведений, что может дать
+        экспоненциальный рост; при distribute=False общие множители сохраняются.
+        budget ограничивает размер (число узлов) результата раскрытия скобок.
+        Результат кэшируется в узле, поэтому каждое поддерево нормализуется один раз
+        """
+        result = trampoline(self._normalize('flatten', distribute, budget))
+        if metrics.enabled():
+            metrics.count('flatten.calls')
+            metrics.count('flatten.nodes_before', self.size)
+            metrics.count('flatten.nodes_after', result.size)
+        return result
+
+    def _normalize(self, operation: str, distribute: bool, budget: Optional[int]) -> Generator:
+        key = (operation, distribute, budget)
+        result = self._cached(key)
+        if result is None:
+            steps = self._flatten if operation == 'flatten' else self._unfold_singles
+            result = self._store(key, (yield steps(distribute, budget)))
+            if result is not self:
+                # Нормализуем и сам результат: если операция на нём ничего не меняет, повторный вызов
+                # будет попаданием в кэш. Операции не обязательно идемпотентны, поэтому результат
+                # не помечается нормализованным без проверки
+                yield result._normalize(operation, distribute, budget)
+        return result
+
+    def _unfold_singles(self, distribute: bool, budget: Optional[int]) -> Generator:
         new_args = []
         args = self.args
         if len(args) == 1:
             arg = args[0]
             if isinstance(arg, Expr):
-                return arg.unfold_singles()
+                return (yield arg._normalize('unfold_singles', distribute, budget))
         for arg in args:
             if isinstance(arg, Expr):
                 if len(arg.args) == 0:
+                    if self.op.sym == '*' and arg.op.sym == '+':
+                        # Пустая сумма -- пустой язык, он поглощает всё произведение
+                        return arg
                     continue
                 elif len(arg.args) == 1:
                     new_args.append(arg.args[0])
                 else:
-                    new_args.append(arg.unfold_singles())
+                    new_args.append((yield arg._normalize('unfold_singles', distribute, budget)))
             elif isinstance(arg, Closure):
                 child = arg.child
                 if isinstance(child, Expr):
-                    child = child.unfold_singles()
+                    child = yield child._normalize('unfold_singles', distribute, budget)
                 new_args.append(Closure(child))
             else:
                 new_args.append(arg)
-        return Expr(self.op, new_args).flatten()
+        return (yield Expr(self.op, new_args)._normalize('flatten', distribute, budget))
 
-    def flatten(self) -> Expr:
+    def _flatten(self, distribute: bool, budget: Optional[int]) -> Generator:
         new_args = []
         for arg in self.args:
             if isinstance(arg, Expr):
-                arg = arg.flatten().unfold_singles()
+                arg = yield arg._normalize('flatten', distribute, budget)
+                arg = yield arg._normalize('unfold_singles', distribute, budget)
                 if arg.op == self.op:
                     new_args += arg.args
                 else:
@@ -169,56 +380,278 @@ class Expr(Item):
             else:
                 new_args.append(arg)
 
-        if self.op.sym == '*' and any(map(lambda a: isinstance(a, Expr) and a.op.sym == '+', new_args)):
-            args = new_args
-            new_args = []
-            sums: list[Expr] = []
-            for arg in args:
+        if self.op.sym == '*' and any(map(lambda a: isinstance(a, Expr) and a.op.sym == '+' and len(a.args) == 0,
+                                          new_args)):
+            return Expr(Op('+'), [])
+
+        if distribute and self.op.sym == '*' and any(map(lambda a: isinstance(a, Expr) and a.op.sym == '+', new_args)):
+            if budget is not None:
+                size = _distributed_size(new_args)
+                if size > budget:
+                    raise ExpressionSizeError(f'Distributing {self} would produce {size} nodes, '
+                                              f'budget is {budget}')
+            # Раскрываем скобки, сохраняя порядок множителей: (a + b) × c => a × c + b × c
+            products: list[list[Item]] = [[]]
+            for arg in new_args:
                 if isinstance(arg, Expr) and arg.op.sym == '+':
-                    sums.append(arg)
+                    products = [product + [x] for product in products for x in arg.args]
                 else:
-                    new_args.append(arg)
-            if len(new_args) > 0:
-                for arg in new_args:
-                    sums.append(
-                        Expr(
-                            Op('+'),
-                            [arg]
-                        )
-                    )
-
-            new_sums = []
-            while len(sums) > 1:
-                inserting_sum = sums[-1]
-                sums = sums[:-1]
-
-                for arg in inserting_sum.args:
-
-                    for s in sums:
-                        sum_els = []
-                        for x in s.args:
-                            sum_els.append(Expr(Op('*'), [arg, x]))
-                        new_sums.append(
-                            Expr(
-                                Op('+'),
-                                sum_els
-                            )
-                        )
-            return Expr(Op('+'), new_sums).flatten()
+                    products = [product + [arg] for product in products]
+            distributed = Expr(Op('+'), [Expr(Op('*'), product) for product in products])
+            return (yield distributed._normalize('flatten', distribute, budget))
 
         return Expr(self.op, new_args)
 
     def __repr__(self) -> str:
-        return f' {self.op} '.join(map(lambda x:
-                                       f'({x})' if isinstance(x, Expr) else
-                                       str(x), self.args))
-
-    def __eq__(self, other) -> bool:
-        if not isinstance(other, Expr):
-            return False
-        if len(self.args) != len(other.args):
-            return False
-        for arg in self.args:
-            if arg not in other.args:
-                return False
-        return True
+        return fold(self, _repr_node)
+
+
+def _merge_elems(args: list[Item]) -> frozenset[Elem]:
+    """
+    Объединение множеств листьев аргументов. Если одно из множеств уже содержит остальные,
+    переиспользуем его, чтобы узлы с одинаковыми листьями хранили один объект
+    """
+    if len(args) == 0:
+        return frozenset()
+    largest = max((arg._elems for arg in args), key=len)
+    if all(arg._elems <= largest for arg in args):
+        return largest
+    return frozenset().union(*(arg._elems for arg in args))
+
+
+def _mix(digest: int, value: int) -> int:
+    return (digest * 1_000_003 + value) & 0xFFFFFFFFFFFFFFFF
+
+
+def _order_key(item: Item) -> tuple[str, int]:
+    """
+    Канонический порядок слагаемых: по началу записи узла, при совпадении -- по структурному дайджесту.
+    Оба считаются из содержимого узла, поэтому порядок одинаков при любой истории вызовов и в разных процессах
+    """
+    return item._label, item._digest
+
+
+def children(item: Item) -> tuple[Item, ...]:
+    if isinstance(item, Expr):
+        return item.args
+    if isinstance(item, Closure):
+        return item.child,
+    return ()
+
+
+def shared_size(item: Item) -> int:
+    """
+    Число различных узлов выражения: общие поддеревья считаются один раз, в отличие от Item.size
+    """
+    return sum(1 for _ in walk(item))
+
+
+def serialize(items: Iterable[Item]) -> tuple[tuple[tuple, ...], tuple[int, ...]]:
+    """
+    Компактная постфиксная запись нескольких выражений: таблица узлов, в которой потомки идут раньше родителя
+    и ссылаются по номеру строки, и номера корней. Общие поддеревья записываются один раз, а запись плоская,
+    поэтому её можно передать в другой процесс через pickle без рекурсии по глубине дерева
+    """
+    table: list[tuple] = []
+    index: dict[Item, int] = {}
+
+    def emit(node: Item, refs: list[int]) -> int:
+        if node not in index:
+            if isinstance(node, Expr):
+                table.append(('x', node.op.sym, tuple(refs)))
+            elif isinstance(node, Closure):
+                table.append(('c', refs[0]))
+            else:
+                table.append(('e', node.sym))
+            index[node] = len(table) - 1
+        return index[node]
+
+    roots = tuple(fold(item, emit, lambda node: node not in index) for item in items)
+    return tuple(table), roots
+
+
+def deserialize(table: tuple[tuple, ...], roots: tuple[int, ...]) -> list[Item]:
+    nodes: list[Item] = []
+    for entry in table:
+        if entry[0] == 'x':
+            nodes.append(Expr(entry[1], [nodes[i] for i in entry[2]]))
+        elif entry[0] == 'c':
+            nodes.append(Closure(nodes[entry[1]]))
+        elif entry[0] == 'e':
+            nodes.append(Elem(entry[1]))
+        else:
+            raise ValueError(f'Unknown node tag {entry[0]!r}')
+    return [nodes[i] for i in roots]
+
+
+def _is_expr(item: Item) -> bool:
+    return isinstance(item, Expr)
+
+
+def walk(item: Item, descend: Optional[Callable[[Item], bool]] = None) -> Iterator[Item]:
+    """
+    Обходит дерево выражения в прямом порядке на явном стеке, поэтому глубина дерева не ограничена
+    стеком интерпретатора. Общие поддеревья выдаются один раз.
+    В потомков узла заходим, только если descend(node) истинно (по умолчанию -- всегда)
+    """
+    seen = set()
+    stack = [item]
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        yield node
+        if descend is None or descend(node):
+            stack.extend(reversed(children(node)))
+
+
+def fold(item: Item, fn: Callable[[Item, list[T]], T], descend: Optional[Callable[[Item], bool]] = None) -> T:
+    """
+    Сворачивает дерево снизу вверх на явном стеке: fn(node, results) получает узел и результаты
+    для его потомков. Для общего поддерева fn вызывается один раз.
+    Узлы, для которых descend(node) ложно, считаются листьями (results пуст)
+    """
+    results: dict[Item, T] = {}
+    stack = [(item, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if node in results:
+            continue
+        kids = children(node) if descend is None or descend(node) else ()
+        if expanded or len(kids) == 0:
+            results[node] = fn(node, [results[kid] for kid in kids])
+        else:
+            stack.append((node, True))
+            stack.extend((kid, False) for kid in reversed(kids) if kid not in results)
+    return results[item]
+
+
+def trampoline(computation: Generator) -> Any:
+    """
+    Выполняет рекурсивное вычисление, записанное генераторами, на явном стеке:
+    чтобы "вызвать" подвычисление, генератор отдаёт yield'ом другой генератор и получает его результат
+    """
+    stack = [computation]
+    value = None
+    while True:
+        try:
+            call = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            if len(stack) == 0:
+                return stop.value
+            value = stop.value
+            continue
+        stack.append(call)
+        value = None
+
+
+def _repr_node(node: Item, args: list[str]) -> str:
+    if isinstance(node, Expr):
+        return f' {node.op} '.join(f'({text})' if isinstance(arg, Expr) else text
+                                   for arg, text in zip(node.args, args))
+    if isinstance(node, Closure):
+        if isinstance(node.child, Expr) and len(node.child.args) > 0:
+            return f'(({args[0]})*)'
+        return f'{args[0]}*'
+    return repr(node)
+
+
+def _distributed_size(factors: list[Item]) -> int:
+    """
+    Размер суммы произведений, получающейся раскрытием скобок в произведении factors
+    """
+    sums = [arg for arg in factors if isinstance(arg, Expr) and arg.op.sym == '+']
+    count = 1
+    for s in sums:
+        count *= max(len(s.args), 1)
+    size = 1 + count * (1 + sum(arg.size for arg in factors if arg not in sums))
+    for s in sums:
+        size += count // max(len(s.args), 1) * sum(arg.size for arg in s.args)
+    return size
+
+
+def _mentions(item: Expr, what: Item) -> bool:
+    """
+    Встречается ли what среди аргументов item или его подвыражений после flatten(distribute=False)
+    """
+    if isinstance(what, Elem) and what not in item.elems:
+        return False
+    seen = {item}
+    stack = [item]
+    while stack:
+        for arg in stack.pop().flatten(distribute=False).args:
+            if isinstance(arg, Expr):
+                if arg not in seen:
+                    seen.add(arg)
+                    stack.append(arg)
+            elif arg == what:
+                return True
+    return False
+
+
+def _expand_terms(item: Item, what: Item) -> Generator:
+    """
+    Возвращает слагаемые раскрытия item вместе с признаком того, что слагаемое содержит what
+    """
+    if not item.has_item(what) or item == what:
+        return [(item, item == what)]
+    if isinstance(item, Expr) and item.op.sym == '+':
+        terms = []
+        for arg in item.args:
+            terms += yield _expand_terms(arg, what)
+        return terms
+    if isinstance(item, Expr) and item.op.sym == '*':
+        prefix = list(item.args[:-1])
+        if any(arg.has_item(what) for arg in prefix):
+            raise ValueError(f'Unable to expand {item}: {what} is not the last factor')
+        terms = []
+        rest = []
+        for term, has_what in (yield _expand_terms(item.args[-1], what)):
+            if has_what:
+                terms.append((Expr('*', prefix + [term]), True))
+            else:
+                rest.append(term)
+        if len(rest) > 0:
+            terms.append((Expr('*', prefix + [Expr('+', rest)]), False))
+        return terms
+    raise ValueError(f'Unable to expand {item} over {what}')
+
+
+def _literal_prefix(item: Item, prefixes: list[tuple[str, bool]]) -> tuple[str, bool]:
+    """
+    Возвращает литерал, с которого начинается любое слово языка выражения,
+    и признак того, что язык состоит ровно из этого литерала.
+    prefixes -- уже посчитанные результаты для аргументов выражения
+    """
+    if isinstance(item, Elem):
+        if str(item.sym) == 'ε':
+            return '', True
+        if isinstance(item.sym, str):
+            return item.sym, True
+        return '', False
+    elif isinstance(item, Closure):
+        return '', False
+    elif isinstance(item, Expr):
+        if item.op.sym == '*':
+            prefix = ''
+            for arg_prefix, exact in prefixes:
+                prefix += arg_prefix
+                if not exact:
+                    return prefix, False
+            return prefix, True
+        elif item.op.sym == '+':
+            if len(prefixes) == 0:
+                return '', False
+            common = prefixes[0][0]
+            for arg_prefix, _ in prefixes[1:]:
+                while not arg_prefix.startswith(common):
+                    common = common[:-1]
+            exact = all(exact and arg_prefix == common for arg_prefix, exact in prefixes)
+            return common, exact
+    raise RuntimeError(f'Unsupported item: {item}')
+
+
+def literal_prefix(item: Item) -> str:
+    return fold(item, _literal_prefix, _is_expr)[0]
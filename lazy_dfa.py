@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from main import FSM
+
+DEFAULT_MAX_STATES = 1024
+DEFAULT_MAX_FLUSHES = 8
+
+
+@dataclass
+class LazyDFAStats:
+    hits: int = 0
+    misses: int = 0
+    flushes: int = 0
+    fallbacks: int = 0
+
+
+class _LazyState:
+    __slots__ = ('nfa_states', 'accepting', 'next')
+
+    def __init__(self, nfa_states: frozenset[str], accepting: bool):
+        self.nfa_states = nfa_states
+        self.accepting = accepting
+        self.next: dict[str, _LazyState] = {}
+
+
+class LazyDFA:
+    """
+    ДКА, строящийся по мере чтения входа: состояние-подмножество и переход по символу
+    вычисляются только тогда, когда вход до них дошёл.
+    Кэш ограничен max_states состояниями и при переполнении сбрасывается целиком.
+    Если за одну проверку кэш сбрасывается больше max_flushes раз, остаток входа
+    проверяется симуляцией НКА без кэширования
+    """
+
+    def __init__(self, fsm: FSM, max_states: int = DEFAULT_MAX_STATES, max_flushes: int = DEFAULT_MAX_FLUSHES):
+        if max_states < 2:
+            raise ValueError(f'Lazy DFA cache must hold at least 2 states, got {max_states}')
+        self.fsm = fsm
+        self.max_states = max_states
+        self.max_flushes = max_flushes
+        self.stats = LazyDFAStats()
+        self._closures = fsm.epsilon_closures()
+        self._moves = fsm.symbol_moves()
+        self._start_states = frozenset(self._closures[fsm.start_state])
+        self._cache: dict[frozenset[str], _LazyState] = {}
+
+    @property
+    def cache_size(self) -> int:
+        return len(self._cache)
+
+    def _step(self, nfa_states: frozenset[str], symbol: str) -> frozenset[str]:
+        reached = set()
+        for name in nfa_states:
+            for target in self._moves[name].get(symbol, ()):
+                reached.update(self._closures[target])
+        return frozenset(reached)
+
+    def _state_for(self, nfa_states: frozenset[str]) -> _LazyState:
+        state = self._cache.get(nfa_states)
+        if state is None:
+            if len(self._cache) >= self.max_states:
+                # Рёбра тоже сбрасываются, иначе вытесненные состояния остаются достижимыми по ссылкам
+                for cached in self._cache.values():
+                    cached.next.clear()
+                self._cache.clear()
+                self.stats.flushes += 1
+            state = _LazyState(nfa_states, any(self.fsm.is_final(name) for name in nfa_states))
+            self._cache[nfa_states] = state
+        return state
+
+    def match(self, chain: str) -> bool:
+        state = self._state_for(self._start_states)
+        flushes_limit = self.stats.flushes + self.max_flushes
+        misses = self.stats.misses
+        processed = 0
+        fallback_from: Optional[int] = None
+        for symbol in chain:
+            processed += 1
+            next_state = state.next.get(symbol)
+            if next_state is None:
+                self.stats.misses += 1
+                next_state = self._state_for(self._step(state.nfa_states, symbol))
+                state.next[symbol] = next_state
+                if self.stats.flushes > flushes_limit:
+                    fallback_from = processed
+                    state = next_state
+                    break
+            state = next_state
+            if len(state.nfa_states) == 0:
+                break
+        self.stats.hits += processed - (self.stats.misses - misses)
+
+        if fallback_from is None:
+            return len(state.nfa_states) > 0 and state.accepting
+
+        # Кэш не справляется с этим входом: дальше без построения состояний ДКА
+        self.stats.fallbacks += 1
+        nfa_states = state.nfa_states
+        for idx in range(fallback_from, len(chain)):
+            if len(nfa_states) == 0:
+                return False
+            nfa_states = self._step(nfa_states, chain[idx])
+        return any(self.fsm.is_final(name) for name in nfa_states)
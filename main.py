@@ -1,16 +1,23 @@
 from __future__ import annotations
 
 import string
+from collections import deque
 from dataclasses import dataclass
-from typing import Union, Any, Optional
+from typing import Union, Any, Callable, Generator, Iterable, Optional, Sequence
 
-from eq_solver import Expr, Elem, Closure, Item
+from compact_fsm import CompactFSM
+from dfa import CompiledDFA
+from eq_solver import Expr, Elem, Closure, Item, literal_prefix, trampoline
 from model.rgrammar import RGrammar
 from model.nterm import Nonterminal, SYMBOL
 import numpy as np
 
+import metrics
+
 from model.rproduction import ProductionCombination
 from regex_solver import RegexEquation, regex_solve
+from simplifier import simplify
+from stream import ChunkMatcher
 from util import print_grammar
 
 
@@ -39,51 +46,175 @@ class FSM:
     start_state: str
     states: dict[str, FSMState]
 
-    def __init__(self, start_state: str, states: list[FSMState]):
+    def __init__(self, start_state: str, states: list[FSMState], final_states: Optional[Iterable[str]] = None):
+        """
+        Если final_states не переданы, конечными считаются состояния без рёбер
+        """
         self.start_state = start_state
         self.states = {}
         for state in states:
             if state.name in self.states.keys():
                 raise RuntimeError(f'Got duplicate state "{state.name}" in a FSM constructor')
             self.states[state.name] = state
+        if final_states is None:
+            final_states = (name for name, state in self.states.items() if len(state.ribs) == 0)
+        self.final_states = frozenset(final_states)
+        for name in self.final_states:
+            if name not in self.states.keys():
+                raise RuntimeError(f'No final state "{name}" found in a FSM')
+        self._closures = None
+        self._moves = None
+        self._dfa: dict[bool, CompiledDFA] = {}
         if start_state not in self.states.keys():
             raise RuntimeError(f'No start state "{start_state}" provided in a FSM')
         for state in self.states.values():
             for rib in state.ribs:
                 if rib.state_name not in self.states.keys():
                     raise RuntimeError(f'No state "{rib.state_name}" found, but referenced from "{state.name}"')
+        if metrics.enabled():
+            metrics.gauge('fsm.states', len(self.states))
+            metrics.gauge('fsm.ribs', sum(len(state.ribs) for state in self.states.values()))
 
     def state_by_name(self, name: str) -> FSMState:
         return self.states[name]
 
-    def apply(self, chain: str, trace: Optional[FSMTrace] = None) -> (bool, FSMState, FSMTrace):
+    def epsilon_closures(self) -> dict[str, dict[str, tuple[str, ...]]]:
+        """
+        Для каждого состояния -- множество состояний, достижимых по ε-рёбрам, вместе с путём до них.
+        В множество попадают только состояния, имеющие рёбра по символу, и конечные состояния:
+        проходные ε-состояния при симуляции не нужны
+        """
+        if self._closures is None:
+            closures = {}
+            for name in self.states.keys():
+                closure = {}
+                paths = {name: ()}
+                queue = deque([name])
+                while queue:
+                    current = queue.popleft()
+                    state = self.states[current]
+                    if current in self.final_states or any(rib.symbol is not None for rib in state.ribs):
+                        closure[current] = paths[current]
+                    for rib in state.ribs:
+                        if rib.symbol is None and rib.state_name not in paths:
+                            paths[rib.state_name] = paths[current] + (rib.state_name,)
+                            queue.append(rib.state_name)
+                closures[name] = closure
+            self._closures = closures
+        return self._closures
+
+    def is_final(self, name: str) -> bool:
+        return name in self.final_states
+
+    def symbol_moves(self) -> dict[str, dict[str, list[str]]]:
+        if self._moves is None:
+            moves = {}
+            for name, state in self.states.items():
+                by_symbol: dict[str, list[str]] = {}
+                for rib in state.ribs:
+                    if rib.symbol is not None:
+                        by_symbol.setdefault(rib.symbol, []).append(rib.state_name)
+                moves[name] = by_symbol
+            self._moves = moves
+        return self._moves
+
+    def advance(self, active: set[str], chain: str) -> set[str]:
+        """
+        Продвигает множество активных состояний по строке.
+        Два множества переиспользуются между шагами, поэтому шаг ничего не выделяет
+        """
+        closures = self.epsilon_closures()
+        moves = self.symbol_moves()
+        active = set(active)
+        reached = set()
+        steps = 0
+        for steps, symbol in enumerate(chain, 1):
+            reached.clear()
+            for name in active:
+                for target in moves[name].get(symbol, ()):
+                    reached.update(closures[target].keys())
+            active, reached = reached, active
+            if len(active) == 0:
+                break
+        metrics.count('fsm.match.steps', steps)
+        return active
+
+    def apply(self,
+              chain: str,
+              trace: Optional[FSMTrace] = None,
+              tracing: bool = False) -> (bool, FSMState, Optional[FSMTrace]):
+        """
+        Симуляция ε-НКА множеством активных состояний: O(len(chain) × states), без рекурсии.
+        Трасса строится только при tracing=True: тогда на каждом шаге запоминается, из какого состояния пришли,
+        а сама трасса восстанавливается по этим ссылкам только для принятой строки.
+        Без трассировки вместо трассы возвращается переданная trace
+        """
+        start = self.start_state if trace is None else trace.last
+        metrics.count('fsm.match.calls')
+        if not tracing:
+            for name in self.advance(set(self.epsilon_closures()[start].keys()), chain):
+                if self.is_final(name):
+                    return True, self.states[name], trace
+            return False, self, trace
+
         if trace is None:
             trace = FSMTrace([self.start_state])
 
-        last_item = self.state_by_name(trace.last)
-
-        if len(last_item.ribs) == 0 and len(chain) == 0:
-            return True, last_item, trace
-
-        # trace = trace.add(last_item.name)
-
-        ribs = []
-        for rib in last_item.ribs:
-            if rib.can_apply(chain):
-                ribs.append(rib)
-        if len(ribs) == 0:
-            return False, self, trace
-
-        for rib in ribs:
-            lookup_state = self.state_by_name(rib.state_name)
-            apply_chain = chain
-            if rib.symbol is not None:
-                apply_chain = apply_chain[1:]
-            result, result_state, new_trace = self.apply(apply_chain, trace.add(lookup_state.name))
-            if result:
-                return True, result_state, new_trace
+        closures = self.epsilon_closures()
+        moves = self.symbol_moves()
+
+        # Шаг -> {состояние: (предыдущее состояние, состояние после ребра по символу)}
+        steps: list[dict[str, tuple[Optional[str], str]]] = [
+            {name: (None, start) for name in closures[start].keys()}
+        ]
+        for symbol in chain:
+            active = {}
+            for name in steps[-1].keys():
+                for target in moves[name].get(symbol, ()):
+                    for reached in closures[target].keys():
+                        if reached not in active:
+                            active[reached] = (name, target)
+            metrics.count('fsm.match.steps')
+            if len(active) == 0:
+                return False, self, trace
+            steps.append(active)
+
+        for name in steps[-1].keys():
+            if self.is_final(name):
+                return True, self.states[name], FSMTrace(trace.items + self._restore_path(steps, name))
         return False, self, trace
 
+    def to_dfa(self, minimize: bool = True) -> CompiledDFA:
+        if minimize not in self._dfa:
+            dfa = CompiledDFA.from_fsm(self)
+            if minimize:
+                dfa, _ = dfa.minimize()
+            self._dfa[minimize] = dfa
+        return self._dfa[minimize]
+
+    def compact(self) -> CompactFSM:
+        return CompactFSM.from_fsm(self)
+
+    def matcher(self) -> FSMMatcher:
+        return FSMMatcher(self)
+
+    def match_many(self, chains: Sequence[str]) -> np.ndarray:
+        return self.to_dfa().match_many(chains)
+
+    def _restore_path(self, steps: list[dict[str, tuple[Optional[str], str]]], name: str) -> list[str]:
+        closures = self.epsilon_closures()
+        parts = []
+        for idx in range(len(steps) - 1, -1, -1):
+            prev, target = steps[idx][name]
+            parts.append(closures[target][name])
+            if idx > 0:
+                parts.append((target,))
+            name = prev
+        items = []
+        for path in reversed(parts):
+            items += path
+        return items
+
     @staticmethod
     def _sanitize_mermaid(s: str) -> str:
         if s == 'end':
@@ -111,6 +242,28 @@ class FSM:
         return '\n'.join(lines)
 
 
+class FSMMatcher(ChunkMatcher):
+    """
+    Потоковая симуляция ε-НКА: между кусками хранится только множество активных состояний
+    """
+
+    def __init__(self, fsm: FSM):
+        super().__init__()
+        self.fsm = fsm
+        self.active: set[str] = set(fsm.epsilon_closures()[fsm.start_state].keys())
+
+    @property
+    def alive(self) -> bool:
+        return len(self.active) > 0
+
+    @property
+    def accepted(self) -> bool:
+        return any(self.fsm.is_final(name) for name in self.active)
+
+    def _feed_text(self, text: str) -> None:
+        self.active = self.fsm.advance(self.active, text)
+
+
 @dataclass
 class FSMTrace:
     items: list[str]
@@ -178,48 +331,84 @@ def char_from_idx(idx: int) -> str:
     return ret
 
 
-def fsm_from_closure(closure: Closure, prefix: str = '', end_ribs: Optional[list[FSMRib]] = None) -> list[FSMState]:
-    start_state = FSMState(prefix + 'start')
-    end_state = FSMState(prefix + 'end', end_ribs)
-    states = []
-    inner_states = fsm_from_item(closure.child, f'{prefix}*.',
-                                 [FSMRib(None, end_state.name), FSMRib(None, f'{prefix}*.start')])
-
-    start_state = start_state.add_ribs([FSMRib(None, inner_states[0].name), FSMRib(None, end_state.name)])
-    return [start_state] + inner_states + [end_state]
+def _build_closure(closure: Closure, prefix: str, end_ribs: Optional[list[FSMRib]],
+                   states: list[FSMState]) -> Generator:
+    if _is_empty_sum(closure.child):
+        # ∅* = ε
+        states += fsm_from_elem(Elem(Nonterminal('ε')), prefix, end_ribs)
+        return
+    end_name = prefix + 'end'
+    states.append(FSMState(prefix + 'start', [FSMRib(None, f'{prefix}*.start'), FSMRib(None, end_name)]))
+    yield _build_item(closure.child, f'{prefix}*.', [FSMRib(None, end_name), FSMRib(None, f'{prefix}*.start')],
+                      states)
+    states.append(FSMState(end_name, end_ribs))
 
 
-def fsm_from_sum(expr: Expr, prefix: str = '', end_ribs: Optional[list[FSMRib]] = None) -> list[FSMState]:
-    start_state = FSMState(prefix + 'start')
-    end_state = FSMState(prefix + 'end', end_ribs)
+def _build_sum(expr: Expr, prefix: str, end_ribs: Optional[list[FSMRib]], states: list[FSMState]) -> Generator:
     internal_end_ribs = [FSMRib(None, prefix + 'end')]
-    states = []
-    idx = 1
-    for arg in expr.args:
-        new_states = fsm_from_item(arg, f'{prefix}{char_from_idx(idx)}.', internal_end_ribs)
-        start_state = start_state.add_ribs([FSMRib(None, f'{prefix}{char_from_idx(idx)}.start')])
-        states += new_states
-        idx += 1
+    start_ribs = [FSMRib(None, f'{prefix}{char_from_idx(idx)}.start') for idx in range(1, len(expr.args) + 1)]
+    if len(start_ribs) == 0:
+        # Пустая сумма -- пустой язык. Состояние без рёбер считается конечным, поэтому начальное состояние
+        # делаем тупиковым: единственное ε-ребро в себя, из него не достижимо ничего
+        start_ribs = [FSMRib(None, prefix + 'start')]
+    states.append(FSMState(prefix + 'start', start_ribs))
+    for idx, arg in enumerate(expr.args, 1):
+        yield _build_item(arg, f'{prefix}{char_from_idx(idx)}.', internal_end_ribs, states)
+    states.append(FSMState(prefix + 'end', end_ribs))
+
+
+def _build_mul(expr: Expr, prefix: str, end_ribs: Optional[list[FSMRib]], states: list[FSMState]) -> Generator:
+    # Конец каждого множителя ведёт в начало следующего, конец последнего -- в конечное состояние
+    end_name = f'{prefix}{char_from_idx(len(expr.args) + 1)}'
+    first = f'{prefix}{char_from_idx(1)}.start' if len(expr.args) > 0 else end_name
+    states.append(FSMState(prefix + 'start', [FSMRib(None, first)]))
+    for idx, arg in enumerate(expr.args, 1):
+        next_name = f'{prefix}{char_from_idx(idx + 1)}.start' if idx < len(expr.args) else end_name
+        yield _build_item(arg, f'{prefix}{char_from_idx(idx)}.', [FSMRib(None, next_name)], states)
+    states.append(FSMState(end_name, end_ribs))
+
+
+def _build_item(item: Item, prefix: str, end_ribs: Optional[list[FSMRib]], states: list[FSMState]) -> Generator:
+    """
+    Строит состояния для item, дописывая их в states. Вложенные выражения строятся через trampoline,
+    поэтому глубина выражения не ограничена стеком интерпретатора
+    """
+    if isinstance(item, Elem):
+        states += fsm_from_elem(item, prefix, end_ribs)
+    elif isinstance(item, Expr):
+        if item.op.sym == '+':
+            yield _build_sum(item, prefix, end_ribs, states)
+        elif item.op.sym == '*':
+            yield _build_mul(item, prefix, end_ribs, states)
+        else:
+            raise RuntimeError(f'Unsupported operation: {item.op}')
+    elif isinstance(item, Closure):
+        yield _build_closure(item, prefix, end_ribs, states)
+    else:
+        raise RuntimeError(f'Sun has been exploded (got {type(item)})')
+
 
-    return [start_state] + states + [end_state]
+def _is_empty_sum(item: Item) -> bool:
+    return isinstance(item, Expr) and item.op.sym == '+' and len(item.args) == 0
+
+
+def _run_builder(builder: Callable[..., Generator], item: Item, prefix: str,
+                 end_ribs: Optional[list[FSMRib]]) -> list[FSMState]:
+    states: list[FSMState] = []
+    trampoline(builder(item, prefix, end_ribs, states))
+    return states
+
+
+def fsm_from_closure(closure: Closure, prefix: str = '', end_ribs: Optional[list[FSMRib]] = None) -> list[FSMState]:
+    return _run_builder(_build_closure, closure, prefix, end_ribs)
+
+
+def fsm_from_sum(expr: Expr, prefix: str = '', end_ribs: Optional[list[FSMRib]] = None) -> list[FSMState]:
+    return _run_builder(_build_sum, expr, prefix, end_ribs)
 
 
 def fsm_from_mul(expr: Expr, prefix: str = '', end_ribs: Optional[list[FSMRib]] = None) -> list[FSMState]:
-    start_state = FSMState(prefix + 'start', [FSMRib(None, f'{prefix}{char_from_idx(1)}.start')])
-    states: list[FSMState] = [start_state]
-    idx = 1
-    for arg in expr.args:
-        internal_end_ribs = [FSMRib(None, f'{prefix}{char_from_idx(idx + 1)}.start')]
-        new_states = fsm_from_item(arg,
-                                   f'{prefix}{char_from_idx(idx)}.',
-                                   internal_end_ribs)
-        states += new_states
-        idx += 1
-
-    end_state = FSMState(f'{prefix}{char_from_idx(idx)}', end_ribs)
-    states[-1] = states[-1].replace_rib(FSMRib(None, f'{prefix}{char_from_idx(idx)}.start'),
-                                        FSMRib(None, end_state.name))
-    return states + [end_state]
+    return _run_builder(_build_mul, expr, prefix, end_ribs)
 
 
 def fsm_from_elem(el: Elem,
@@ -241,48 +430,183 @@ def fsm_from_elem(el: Elem,
 
 
 def fsm_from_expression(expr: Expr, prefix: str = '', end_ribs: Optional[list[FSMRib]] = None) -> list[FSMState]:
-    if expr.op.sym == '+':
-        return fsm_from_sum(expr, prefix, end_ribs)
-    elif expr.op.sym == '*':
-        return fsm_from_mul(expr, prefix, end_ribs)
-    else:
-        raise RuntimeError(f'Unsupported operation: {expr.op}')
+    return _run_builder(_build_item, expr, prefix, end_ribs)
 
 
 def fsm_from_item(item: Item, prefix: str = '', end_ribs: Optional[list[FSMRib]] = None) -> list[FSMState]:
+    with metrics.stage('fsm_from_item'):
+        return _run_builder(_build_item, item, prefix, end_ribs)
+
+
+def _glushkov(item: Item, symbols: list[str], follow: list[set[int]]) -> Generator:
+    """
+    Для каждого вхождения символа в item заводит позицию (номер в symbols) и дополняет follow --
+    множества позиций, которые могут идти следом.
+    Возвращает (допускает ли item пустое слово, множество первых позиций, множество последних позиций)
+    """
     if isinstance(item, Elem):
-        return fsm_from_elem(item, prefix, end_ribs)
-    elif isinstance(item, Expr):
-        return fsm_from_expression(item, prefix, end_ribs)
+        if str(item) == 'ε':
+            return True, set(), set()
+        symbols.append(item.sym)
+        follow.append(set())
+        return False, {len(symbols) - 1}, {len(symbols) - 1}
     elif isinstance(item, Closure):
-        return fsm_from_closure(item, prefix, end_ribs)
-    else:
-        raise RuntimeError(f'Sun has been exploded (got {type(item)})')
+        _, first, last = yield _glushkov(item.child, symbols, follow)
+        for position in last:
+            follow[position] |= first
+        return True, first, last
+    elif isinstance(item, Expr) and item.op.sym == '+':
+        nullable = False
+        first: set[int] = set()
+        last: set[int] = set()
+        for arg in item.args:
+            arg_nullable, arg_first, arg_last = yield _glushkov(arg, symbols, follow)
+            nullable = nullable or arg_nullable
+            first |= arg_first
+            last |= arg_last
+        return nullable, first, last
+    elif isinstance(item, Expr) and item.op.sym == '*':
+        nullable = True
+        first = set()
+        last = set()
+        for arg in item.args:
+            arg_nullable, arg_first, arg_last = yield _glushkov(arg, symbols, follow)
+            for position in last:
+                follow[position] |= arg_first
+            if nullable:
+                first |= arg_first
+            last = last | arg_last if arg_nullable else arg_last
+            nullable = nullable and arg_nullable
+        return nullable, first, last
+    raise RuntimeError(f'Unsupported item: {item}')
+
+
+def glushkov_fsm(item: Item) -> FSM:
+    """
+    Позиционный автомат Глушкова: без ε-рёбер, одно состояние на каждое вхождение символа в выражение
+    плюс начальное. Переход в позицию идёт по её символу, конечны последние позиции
+    (и начальное состояние, если выражение допускает пустое слово)
+    """
+    symbols: list[str] = []
+    follow: list[set[int]] = []
+    with metrics.stage('glushkov'):
+        nullable, first, last = trampoline(_glushkov(item, symbols, follow))
+    names = [f'{position + 1}.{symbol}' for position, symbol in enumerate(symbols)]
+
+    def ribs(positions: set[int]) -> list[FSMRib]:
+        return [FSMRib(symbols[position], names[position]) for position in sorted(positions)]
+
+    states = [FSMState('start', ribs(first))]
+    states += [FSMState(name, ribs(follow[position])) for position, name in enumerate(names)]
+    final_states = [names[position] for position in last]
+    if nullable:
+        final_states.append('start')
+    return FSM('start', states, final_states)
+
+
+def thompson_fsm(item: Item) -> FSM:
+    return FSM('start', fsm_from_item(item))
+
+
+FSM_BUILDERS: dict[str, Callable[[Item], FSM]] = {
+    'thompson': thompson_fsm,
+    'glushkov': glushkov_fsm,
+}
+
+
+def build_fsm(item: Item, method: str = 'thompson') -> FSM:
+    """
+    method: 'thompson' -- ε-НКА по структуре выражения (fsm_from_item),
+    'glushkov' -- позиционный автомат без ε-рёбер (glushkov_fsm)
+    """
+    if method not in FSM_BUILDERS:
+        raise ValueError(f'Unknown FSM construction method "{method}", expected one of {list(FSM_BUILDERS)}')
+    return FSM_BUILDERS[method](item)
+
+
+def fsm_from_grammar(grammar: RGrammar) -> FSM:
+    """
+    Праволинейная грамматика -- уже НКА, поэтому автомат строится прямо по продукциям за линейное время,
+    без решения уравнений: состояние на каждый нетерминал, продукция X -> a b Y -- цепочка переходов
+    по a и b из X в Y. Продукции без нетерминала в конце (или с ε) ведут в единственное конечное состояние end.
+    Регулярное выражение (regex_from_grammar) нужно, только если требуется его запись
+    """
+    end_name = 'end'
+    ribs: dict[str, list[FSMRib]] = {str(grammar.start): []}
+    with metrics.stage('fsm_from_grammar'):
+        for idx, p in enumerate(grammar.productions):
+            name = str(p.lhs)
+            ribs.setdefault(name, [])
+            nterm = p.rule.nterm
+            target = end_name if nterm is None or nterm == Nonterminal('ε') else str(nterm)
+            ribs.setdefault(target, [])
+            if len(p.rule.terms) == 0:
+                ribs[name].append(FSMRib(None, target))
+                continue
+            for term_idx, term in enumerate(p.rule.terms):
+                next_name = target if term_idx == len(p.rule.terms) - 1 else f'{p.lhs}.{idx}.{term_idx + 1}'
+                ribs[name].append(FSMRib(term, next_name))
+                ribs.setdefault(next_name, [])
+                name = next_name
+        ribs.setdefault(end_name, [])
+        return FSM(str(grammar.start), [FSMState(name, state_ribs) for name, state_ribs in ribs.items()], [end_name])
+
+
+def regex_from_grammar(grammar: RGrammar, simplified: bool = True) -> Item:
+    """
+    При simplified=True выражение упрощается по тождествам алгебры Клини (см. simplifier.simplify)
+    """
+    eqs = regex_solve(RegexEquation.expr_from_grammar(grammar))
+    regex = list(filter(lambda x: x.X.sym == grammar.start, eqs))[0].calculate_result()
+    if simplified:
+        regex, _ = simplify(regex)
+    return regex
+
+
+def dfa_from_grammars(grammars: list[RGrammar]) -> CompiledDFA:
+    """
+    Общий автомат для нескольких грамматик: match_ids возвращает номера грамматик (в порядке grammars),
+    которым принадлежит строка
+    """
+    fsms = [fsm_from_grammar(grammar) for grammar in grammars]
+    dfa, _ = CompiledDFA.from_fsms(fsms).minimize()
+    return dfa
+
+
+def dfa_from_item(item: Item) -> CompiledDFA:
+    dfa, _ = CompiledDFA.from_fsm(FSM('start', fsm_from_item(item)), literal_prefix(item)).minimize()
+    return dfa
 
 
 def main():
-    grammar = RGrammar.fromstring(input_grammar())
+    with metrics.instrument() as collected:
+        grammar = RGrammar.fromstring(input_grammar())
+
+        print('Input grammar:')
+        print_grammar(grammar)
 
-    print('Input grammar:')
-    print_grammar(grammar)
+        eqs: list[RegexEquation] = RegexEquation.expr_from_grammar(grammar)
 
-    eqs: list[RegexEquation] = RegexEquation.expr_from_grammar(grammar)
+        print('\nInput eqs: ')
+        for eq in eqs:
+            print(f'> {eq}')
 
-    print('\nInput eqs: ')
-    for eq in eqs:
-        print(f'> {eq}')
+        eqs = regex_solve(eqs)
 
-    eqs = regex_solve(eqs)
+        print('\nSolved eqs: ')
+        for eq in eqs:
+            print(f'> {eq}')
 
-    print('\nSolved eqs: ')
-    for eq in eqs:
-        print(f'> {eq}')
+        interested_regex = list(filter(lambda x: x.X.sym == grammar.start, eqs))[0].calculate_result()
 
-    interested_regex = list(filter(lambda x: x.X.sym == grammar.start, eqs))[0].calculate_result()
+        print(f'Calculated regex: {interested_regex}')
+        interested_regex, report = simplify(interested_regex)
+        print(f'Simplified regex: {interested_regex}')
+        print(f'{report}\n')
 
-    print(f'Calculated regex: {interested_regex}\n')
+        s = FSM('start', fsm_from_item(interested_regex))
 
-    s = FSM('start', fsm_from_item(interested_regex))
+    print(f'Pipeline metrics: {collected.to_json()}')
 
     print(s)
     print()
@@ -295,7 +619,7 @@ def main():
         except EOFError:
             print('Exiting')
             break
-        print(s.apply(test_str))
+        print(s.apply(test_str, tracing=True))
     # fsm = FSM(
     #     'start',
     #     [
@@ -0,0 +1,116 @@
+"""
+Необязательные метрики конвейера: время этапов, счётчики и показатели (размеры выражений, автоматов, число шагов).
+Пока сбор не включён через instrument(), каждая точка замера -- одна проверка глобальной переменной
+"""
+from __future__ import annotations
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, ContextManager, Iterator, Optional, Protocol
+
+
+class Observer(Protocol):
+    def on_stage(self, name: str, seconds: float) -> None:
+        ...
+
+    def on_count(self, name: str, value: int) -> None:
+        ...
+
+    def on_gauge(self, name: str, value: float) -> None:
+        ...
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class Metrics:
+    """
+    Собирает события: время этапов суммируется по вызовам, счётчики складываются,
+    показатель хранит последнее значение. observers получают каждое событие сразу
+    """
+    stages: dict[str, StageStats] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+    gauges: dict[str, float] = field(default_factory=dict)
+    observers: list[Observer] = field(default_factory=list)
+
+    def on_stage(self, name: str, seconds: float) -> None:
+        stats = self.stages.setdefault(name, StageStats())
+        stats.calls += 1
+        stats.seconds += seconds
+        for observer in self.observers:
+            observer.on_stage(name, seconds)
+
+    def on_count(self, name: str, value: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+        for observer in self.observers:
+            observer.on_count(name, value)
+
+    def on_gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+        for observer in self.observers:
+            observer.on_gauge(name, value)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'stages': {name: {'calls': stats.calls, 'seconds': stats.seconds} for name, stats in self.stages.items()},
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.as_dict(), **kwargs)
+
+
+# Текущий сборщик; None -- метрики выключены
+_active: Optional[Metrics] = None
+_NULL_STAGE = nullcontext()
+
+
+def enabled() -> bool:
+    return _active is not None
+
+
+@contextmanager
+def instrument(*observers: Observer) -> Iterator[Metrics]:
+    """
+    Включает сбор метрик внутри блока with. Вложенный instrument собирает свои метрики,
+    внешний на это время не получает событий
+    """
+    global _active
+    previous = _active
+    _active = Metrics(observers=list(observers))
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+@contextmanager
+def _timed(metrics: Metrics, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.on_stage(name, time.perf_counter() - start)
+
+
+def stage(name: str) -> ContextManager[None]:
+    if _active is None:
+        return _NULL_STAGE
+    return _timed(_active, name)
+
+
+def count(name: str, value: int = 1) -> None:
+    if _active is not None:
+        _active.on_count(name, value)
+
+
+def gauge(name: str, value: float) -> None:
+    if _active is not None:
+        _active.on_gauge(name, value)
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from mmap import mmap
+from typing import IO, Iterable, Iterator, Optional, Union
+
+from model.nterm import Nonterminal, SYMBOL
+from model.rproduction import RProduction, RProductionRule
+
+ARROW = '->'
+ALTERNATIVE = '|'
+
+Source = Union[IO[str], IO[bytes], mmap, Iterable[Union[str, bytes]]]
+
+
+class GrammarSyntaxError(ValueError):
+    def __init__(self, message: str, line: int, column: int):
+        super().__init__(f'{message} (line {line}, column {column})')
+        self.line = line
+        self.column = column
+
+
+class SymbolTable:
+    """
+    Интернирование символов грамматики: каждый различный токен классифицируется (терминал или нетерминал)
+    один раз, а равные токены дают один и тот же объект символа
+    """
+
+    def __init__(self):
+        self._symbols: dict[str, SYMBOL] = {}
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def symbol(self, token: str) -> SYMBOL:
+        symbol = self._symbols.get(token)
+        if symbol is None:
+            symbol = self._symbols[token] = Nonterminal.from_string(token)
+        return symbol
+
+
+def _column(line: str, pos: int) -> int:
+    """
+    Номер столбца (с 1) первого непробельного символа, начиная с pos
+    """
+    while pos < len(line) and line[pos].isspace():
+        pos += 1
+    return pos + 1
+
+
+def parse_line(line: str, line_no: int, symbols: SymbolTable) -> list[RProduction]:
+    """
+    Разбирает строку вида `A -> a b B | c | ε` за один проход по её альтернативам
+    """
+    arrow = line.find(ARROW)
+    if arrow < 0:
+        raise GrammarSyntaxError(f'Expected "{ARROW}"', line_no, _column(line, 0))
+    if line.find(ARROW, arrow + len(ARROW)) >= 0:
+        raise GrammarSyntaxError(f'Unexpected second "{ARROW}"', line_no, line.find(ARROW, arrow + len(ARROW)) + 1)
+    lhs_token = line[:arrow].strip()
+    if len(lhs_token) == 0:
+        raise GrammarSyntaxError('Expected a nonterminal before the arrow', line_no, _column(line, 0))
+    lhs = symbols.symbol(lhs_token)
+
+    productions = []
+    known = symbols._symbols
+    pos = arrow + len(ARROW)
+    for alternative in line[pos:].split(ALTERNATIVE):
+        tokens = alternative.split()
+        if len(tokens) == 0:
+            raise GrammarSyntaxError('Empty alternative', line_no, _column(line, pos))
+        terms = tuple([known[token] if token in known else symbols.symbol(token) for token in tokens])
+        nterm = terms[-1]
+        if isinstance(nterm, Nonterminal):
+            terms = terms[:-1]
+        else:
+            nterm = None
+        productions.append(RProduction(lhs, RProductionRule(terms, nterm)))
+        pos += len(alternative) + len(ALTERNATIVE)
+    return productions
+
+
+def read_lines(source: Source) -> Iterator[str]:
+    """
+    Строки из текстового или двоичного файла, mmap или любого итератора строк -- по одной,
+    без чтения всего источника в память. Байты декодируются как UTF-8
+    """
+    if isinstance(source, mmap):
+        source = iter(source.readline, b'')
+    for line_no, line in enumerate(source, 1):
+        if isinstance(line, (bytes, bytearray)):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise GrammarSyntaxError(f'Invalid UTF-8: {e.reason}', line_no, e.start + 1) from e
+        yield line
+
+
+def iter_productions(lines: Iterable[str], symbols: Optional[SymbolTable] = None) -> Iterator[RProduction]:
+    """
+    Продукции по строкам грамматики; пустые строки пропускаются. Ошибки -- GrammarSyntaxError с позицией
+    """
+    if symbols is None:
+        symbols = SymbolTable()
+    for line_no, line in enumerate(lines, 1):
+        if len(line) == 0 or line.isspace():
+            continue
+        yield from parse_line(line, line_no, symbols)
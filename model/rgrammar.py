@@ -1,15 +1,20 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Optional, Generic, TypeVar
+from dataclasses import dataclass, field
+from os import PathLike
+from typing import Iterable, Iterator, Optional, Generic, TypeVar, Union
 
+import metrics
 from model.nterm import Nonterminal, EPSYLON_SYMBOL
-from model.rproduction import RProduction, ProductionCombination
+from model.parser import Source, iter_productions, read_lines
+from model.rproduction import RProduction, ProductionCombination, RProductionRule
 
 
 @dataclass(frozen=True)
 class RGrammar:
     _start: Nonterminal
     _productions: list[RProduction]
+    # lhs -> правила в порядке появления; строится при загрузке или при первом обращении
+    _by_lhs: Optional[dict[Nonterminal, list[RProductionRule]]] = field(default=None, compare=False, repr=False)
 
     @property
     def start(self) -> Nonterminal:
@@ -19,47 +24,63 @@ class RGrammar:
     def productions(self) -> list[RProduction]:
         return self._productions.copy()
 
+    def _index(self) -> dict[Nonterminal, list[RProductionRule]]:
+        if self._by_lhs is None:
+            by_lhs: dict[Nonterminal, list[RProductionRule]] = {}
+            for p in self._productions:
+                by_lhs.setdefault(p.lhs, []).append(p.rule)
+            object.__setattr__(self, '_by_lhs', by_lhs)
+        return self._by_lhs
+
     def productions_by_lhs(self, lhs: Nonterminal) -> ProductionCombination:
-        ret = []
-        for p in self._productions:
-            if p.lhs == lhs:
-                ret.append(p.rule)
-        return ProductionCombination(lhs, ret)
+        return ProductionCombination(lhs, list(self._index().get(lhs, ())))
 
     @classmethod
     def fromstring(cls, s: str, start: Optional[Nonterminal] = None) -> RGrammar:
-        productions = list()
-        start = None
-        for line in s.split('\n'):
-            line = line.strip()
-            if len(line) == 0:
-                continue
+        """
+        Ошибки разбора -- model.parser.GrammarSyntaxError с номером строки и столбца
+        """
+        return cls._from_lines(s.split('\n'))
 
-            p_s = RProduction.from_string(line)
-            if start is None:
-                start = p_s[0].lhs
-            for p in p_s:
-                productions.append(p)
+    @classmethod
+    def from_file(cls, source: Union[str, PathLike, Source]) -> RGrammar:
+        """
+        Загружает грамматику из пути, файла (текстового или двоичного) или mmap построчно:
+        продукции разбираются по мере чтения, индекс по левой части строится сразу же,
+        а весь текст в памяти не держится
+        """
+        if isinstance(source, (str, PathLike)):
+            with open(source, encoding='utf-8') as f:
+                return cls._from_lines(f)
+        return cls._from_lines(read_lines(source))
+
+    @staticmethod
+    def iter_productions(source: Source) -> Iterator[RProduction]:
+        """
+        Продукции из файла или mmap по одной, не накапливая их
+        """
+        return iter_productions(read_lines(source))
 
-        if start is None:
-            start = Nonterminal('S')
-            productions = [RProduction.from_string('S -> ε')]
+    @classmethod
+    def _from_lines(cls, lines: Iterable[str]) -> RGrammar:
+        productions = []
+        by_lhs: dict[Nonterminal, list[RProductionRule]] = {}
+        with metrics.stage('parse'):
+            for p in iter_productions(lines):
+                productions.append(p)
+                by_lhs.setdefault(p.lhs, []).append(p.rule)
 
-        return RGrammar(start, productions)
+        if len(productions) == 0:
+            return RGrammar(Nonterminal('S'), RProduction.from_string('S -> ε'))
+        return RGrammar(productions[0].lhs, productions, by_lhs)
 
     @property
     def nterms(self) -> list[Nonterminal]:
-        ret = []
-
+        ret = dict.fromkeys(self._index().keys())
         for p in self._productions:
-            if p.lhs not in ret:
-                ret.append(p.lhs)
-
-        for p in self._productions:
-            if p.rule.nterm is not None and p.rule.nterm not in ret:
-                ret.append(p.rule.nterm)
-
-        return ret
+            if p.rule.nterm is not None:
+                ret.setdefault(p.rule.nterm)
+        return list(ret.keys())
 
     def copy_with(self,
                   start: Optional[Nonterminal] = None,
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from dataclasses import dataclass
+from typing import Iterable, Optional
 
-from eq_solver import Expr, Elem, Closure, Item
-from model.nterm import Nonterminal
+import metrics
+from eq_solver import Expr, Elem, Closure, Item, ExpressionSizeError, deserialize, serialize, shared_size
+from model.nterm import Nonterminal, EPSYLON_SYMBOL
 from model.rgrammar import RGrammar
-from model.rproduction import ProductionCombination
+from model.rproduction import ProductionCombination, RProductionRule
+
+DEFAULT_MAX_EXPR_SIZE = 1_000_000
 
 
 @dataclass
@@ -19,7 +24,7 @@ class RegexEquation:
         Преобразовывает αX+β => (α*)×β
         Уравнение 2.2.1 -- Ахо А., Ульман Дж. Теория синтаксического анализа, перевода и компиляции
         """
-        return Expr('*', [Closure(self.alpha), self.beta]).flatten()
+        return Expr('*', [Closure(self.alpha), self.beta]).flatten(distribute=False)
 
     def __repr__(self) -> str:
         return (f'RegexEquation('
@@ -29,24 +34,12 @@ class RegexEquation:
                 f')')
 
     def replace_beta(self, replace_what: Item, replace_with: Item) -> RegexEquation:
-        return RegexEquation(self.alpha, self.X, self.beta.replace(replace_what, replace_with).flatten())
+        return RegexEquation(self.alpha, self.X, self.beta.replace(replace_what, replace_with).flatten(distribute=False))
 
     @classmethod
     def from_expr(cls, expr: Expr, X: Elem):
-
-        beta, extracted = expr.extract(X)
-
-        alpha_els = []
-        for e in extracted:
-            if isinstance(e, Expr):
-                e, new_e = e.extract(X)
-                if len(new_e) > 1:
-                    raise ValueError(f'Unable to extract {X} from equation {expr}')
-            if e == X:
-                e = Elem(Nonterminal('ε'))
-            alpha_els.append(e)
-        alpha = Expr('+', alpha_els).flatten()
-        return RegexEquation(alpha, X, beta.flatten())
+        alpha, beta = expr.split(X, Elem(Nonterminal('ε')))
+        return RegexEquation(alpha, X, beta)
 
     def rearrange_X(self) -> RegexEquation:
         expr = Expr(
@@ -59,7 +52,7 @@ class RegexEquation:
                      ]),
                 self.beta
             ]
-        ).flatten()
+        ).flatten(distribute=False)
         return self.from_expr(expr, self.X)
 
     @classmethod
@@ -77,36 +70,314 @@ class RegexEquation:
     @classmethod
     def expr_from_grammar(cls, g: RGrammar) -> list[RegexEquation]:
         eqs = []
-        nterms = g.nterms
-        for nterm in nterms:
-            if nterm == Nonterminal('ε'):
-                continue
-            X = Elem(nterm)
-            rules = g.productions_by_lhs(nterm)
-            expr = cls.expr_from_productions(rules)
-            eqs.append(RegexEquation.from_expr(expr, X))
+        with metrics.stage('expr_from_grammar'):
+            nterms = g.nterms
+            for nterm in nterms:
+                if nterm == Nonterminal('ε'):
+                    continue
+                X = Elem(nterm)
+                rules = g.productions_by_lhs(nterm)
+                expr = cls.expr_from_productions(rules)
+                eqs.append(RegexEquation.from_expr(expr, X))
         return eqs
 
 
-def regex_solve(eqs: list[RegexEquation]) -> list[RegexEquation]:
-    eqs = eqs.copy()
-    size = len(eqs)
+def dependency_graph(eqs: list[RegexEquation]) -> dict[Elem, list[Elem]]:
+    """
+    Для каждой переменной -- переменные (из тех, для которых есть уравнение), входящие в её β
+    """
+    variables = {eq.X for eq in eqs}
+    return {eq.X: [X for X in eq.beta.elems if X in variables and X != eq.X] for eq in eqs}
 
-    prev_eqs = []
-    while prev_eqs != eqs:
-        prev_eqs = eqs
-        for i in range(size):
-            for j in range(size):
-                eq = eqs[i]
-                subeq = eqs[j]
-                if eq.X == subeq.X:
-                    continue
-                if subeq.beta.has_item(eq.X):
-                    res = eq.calculate_result().flatten()
-                    # print(f'Подставляем {res} в выражение для {subeq.X}')
-                    subeq = subeq.replace_beta(eq.X, res)
-                    if subeq.beta.has_item(subeq.X):
-                        # print(f'Реорганизовываем выражение для {subeq.X}')
-                        subeq = subeq.rearrange_X()
-                    eqs[j] = subeq
+
+def strongly_connected_components(graph: dict[Elem, list[Elem]]) -> list[list[Elem]]:
+    """
+    Компоненты сильной связности алгоритмом Тарьяна на явном стеке.
+    Компонента выдаётся после всех компонент, от которых она зависит, то есть в порядке решения
+    """
+    index: dict[Elem, int] = {}
+    lowlink: dict[Elem, int] = {}
+    on_stack: set[Elem] = set()
+    stack: list[Elem] = []
+    components: list[list[Elem]] = []
+
+    for root in graph.keys():
+        if root in index:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, edge = work.pop()
+            if edge == 0:
+                index[node] = lowlink[node] = len(index)
+                stack.append(node)
+                on_stack.add(node)
+            successors = graph[node]
+            while edge < len(successors):
+                successor = successors[edge]
+                edge += 1
+                if successor not in index:
+                    work.append((node, edge))
+                    work.append((successor, 0))
+                    break
+                if successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+    return components
+
+
+def _substitute(eq: RegexEquation, X: Elem, solution: Item, max_size: Optional[int]) -> RegexEquation:
+    metrics.count('solve.substitutions')
+    eq = eq.replace_beta(X, solution)
+    if eq.beta.has_item(eq.X):
+        eq = eq.rearrange_X()
+    # size не меньше числа различных узлов, поэтому обход нужен, только когда дерево велико
+    if max_size is not None and eq.beta.size > max_size:
+        nodes = shared_size(eq.beta)
+        if nodes > max_size:
+            raise ExpressionSizeError(f'Equation for {eq.X} grew to {nodes} nodes, budget is {max_size}')
+    return eq
+
+
+def solve_component(eqs: list[RegexEquation],
+                    solved: dict[Elem, Item],
+                    max_size: Optional[int] = DEFAULT_MAX_EXPR_SIZE) -> list[RegexEquation]:
+    """
+    Решает уравнения одной компоненты сильной связности. solved -- решения (α*)×β уже решённых переменных,
+    от которых компонента зависит; они подставляются в каждое уравнение один раз.
+    Внутри компоненты -- исключение Гаусса: решаем первое уравнение по правилу Ардена относительно остальных
+    переменных, подставляем в следующие, затем обратной подстановкой получаем замкнутые решения
+    """
+    metrics.count('solve.components')
+    eqs = list(eqs)
+    for i, eq in enumerate(eqs):
+        for X in [X for X in eq.beta.elems if X in solved]:
+            eq = _substitute(eq, X, solved[X], max_size)
+        eqs[i] = eq
+
+    for i in range(len(eqs)):
+        result = eqs[i].calculate_result()
+        for j in range(i + 1, len(eqs)):
+            if eqs[j].beta.has_item(eqs[i].X):
+                eqs[j] = _substitute(eqs[j], eqs[i].X, result, max_size)
+
+    for i in range(len(eqs) - 1, -1, -1):
+        result = eqs[i].calculate_result()
+        for j in range(i - 1, -1, -1):
+            if eqs[j].beta.has_item(eqs[i].X):
+                eqs[j] = _substitute(eqs[j], eqs[i].X, result, max_size)
     return eqs
+
+
+def _solve_serialized(variables: list[Elem],
+                      external: list[Elem],
+                      table: tuple[tuple, ...],
+                      roots: tuple[int, ...],
+                      max_size: Optional[int]) -> tuple[tuple[tuple, ...], tuple[int, ...]]:
+    """
+    Решение компоненты в процессе-исполнителе. На входе -- α и β уравнений компоненты, затем решения,
+    от которых она зависит; на выходе -- α и β решённых уравнений в той же записи
+    """
+    items = deserialize(table, roots)
+    eqs = [RegexEquation(items[2 * i], X, items[2 * i + 1]) for i, X in enumerate(variables)]
+    solved = dict(zip(external, items[2 * len(variables):]))
+    result = solve_component(eqs, solved, max_size)
+    return serialize([item for eq in result for item in (eq.alpha, eq.beta)])
+
+
+def _external(eqs: list[RegexEquation]) -> list[Elem]:
+    """
+    Переменные вне компоненты, входящие в правые части её уравнений
+    """
+    own = {eq.X for eq in eqs}
+    return list(dict.fromkeys(X for eq in eqs for X in eq.beta.elems
+                              if X not in own and isinstance(X.sym, Nonterminal)))
+
+
+def _solve_parallel(eqs: list[RegexEquation],
+                    components: list[list[Elem]],
+                    max_size: Optional[int],
+                    workers: int) -> dict[Elem, RegexEquation]:
+    """
+    Компоненты без взаимных зависимостей решаются параллельно: компонента отправляется в пул,
+    как только решены все компоненты, от которых она зависит
+    """
+    by_X = {eq.X: eq for eq in eqs}
+    component_of = {X: i for i, component in enumerate(components) for X in component}
+    waiting_for: list[int] = []
+    dependents: list[list[int]] = [[] for _ in components]
+    for i, component in enumerate(components):
+        depends_on = {component_of[X] for X in _external([by_X[X] for X in component]) if X in component_of}
+        waiting_for.append(len(depends_on))
+        for j in depends_on:
+            dependents[j].append(i)
+
+    solved: dict[Elem, Item] = {}
+    result: dict[Elem, RegexEquation] = {}
+    running: dict[Future, int] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(i: int) -> None:
+            component_eqs = [by_X[X] for X in components[i]]
+            external = [X for X in _external(component_eqs) if X in solved]
+            items = [item for eq in component_eqs for item in (eq.alpha, eq.beta)] + [solved[X] for X in external]
+            running[pool.submit(_solve_serialized, components[i], external, *serialize(items), max_size)] = i
+
+        for i in range(len(components)):
+            if waiting_for[i] == 0:
+                submit(i)
+        while running:
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                items = deserialize(*future.result())
+                for k, X in enumerate(components[i]):
+                    eq = RegexEquation(items[2 * k], X, items[2 * k + 1])
+                    result[X] = eq
+                    solved[X] = eq.calculate_result()
+                for j in dependents[i]:
+                    waiting_for[j] -= 1
+                    if waiting_for[j] == 0:
+                        submit(j)
+    return result
+
+
+def regex_solve(eqs: list[RegexEquation],
+                max_size: Optional[int] = DEFAULT_MAX_EXPR_SIZE,
+                workers: Optional[int] = None) -> list[RegexEquation]:
+    """
+    Выражения хранятся в факторизованном виде: скобки раскрываются только вокруг подставляемой переменной.
+    Переменные исключаются по компонентам сильной связности графа зависимостей в топологическом порядке,
+    поэтому каждая подстановка делается один раз.
+    max_size ограничивает число различных узлов правой части любого уравнения: узлы интернированы,
+    поэтому общие поддеревья хранятся и считаются один раз.
+    workers -- число процессов для независимых компонент; по умолчанию всё решается в текущем процессе
+    """
+    with metrics.stage('regex_solve'):
+        components = strongly_connected_components(dependency_graph(eqs))
+        if workers is not None:
+            # Счётчики исполнителей остаются в их процессах
+            metrics.count('solve.components', len(components))
+            result = _solve_parallel(eqs, components, max_size, workers)
+            return [result[eq.X] for eq in eqs]
+
+        by_X = {eq.X: eq for eq in eqs}
+        solved: dict[Elem, Item] = {}
+        result: dict[Elem, RegexEquation] = {}
+        for component in components:
+            for eq in solve_component([by_X[X] for X in component], solved, max_size):
+                result[eq.X] = eq
+                solved[eq.X] = eq.calculate_result()
+        return [result[eq.X] for eq in eqs]
+
+class SolverSession:
+    """
+    Решённая система уравнений грамматики, которую можно править по одному нетерминалу.
+    Хранит исходные уравнения, решения и обратный граф зависимостей; после правки продукций нетерминала
+    заново решаются только уравнения, которые от него транзитивно зависят
+    """
+
+    def __init__(self, grammar: RGrammar, max_size: Optional[int] = DEFAULT_MAX_EXPR_SIZE):
+        self.max_size = max_size
+        self._rules: dict[Nonterminal, tuple[RProductionRule, ...]] = self._group_rules(grammar)
+        # Нерешённые уравнения в порядке появления нетерминалов
+        self._equations: dict[Elem, RegexEquation] = {}
+        self._graph: dict[Elem, list[Elem]] = {}
+        self._dependents: dict[Elem, set[Elem]] = {}
+        self._solutions: dict[Elem, RegexEquation] = {}
+        self._results: dict[Elem, Item] = {}
+        for eq in RegexEquation.expr_from_grammar(grammar):
+            self._set_equation(eq)
+        self._resolve(set(self._equations.keys()))
+
+    @property
+    def equations(self) -> list[RegexEquation]:
+        return [self._solutions[X] for X in self._equations.keys()]
+
+    def solution(self, nterm: Nonterminal) -> Item:
+        """
+        Регулярное выражение языка, выводимого из нетерминала
+        """
+        return self._results[Elem(nterm)]
+
+    def update(self, nterm: Nonterminal, rules: Iterable[RProductionRule]) -> list[Elem]:
+        """
+        Заменяет продукции нетерминала и перерешивает зависящие от него уравнения.
+        Возвращает переменные, уравнения которых были решены заново
+        """
+        return self._update({nterm: tuple(rules)})
+
+    def update_grammar(self, grammar: RGrammar) -> list[Elem]:
+        """
+        Сравнивает продукции с новой грамматикой и перерешивает только изменившиеся нетерминалы
+        """
+        rules = self._group_rules(grammar)
+        changed = {nterm: variants for nterm, variants in rules.items() if self._rules.get(nterm) != variants}
+        for nterm in self._rules.keys():
+            if nterm not in rules:
+                changed[nterm] = tuple()
+        return self._update(changed)
+
+    @staticmethod
+    def _group_rules(grammar: RGrammar) -> dict[Nonterminal, tuple[RProductionRule, ...]]:
+        rules: dict[Nonterminal, list[RProductionRule]] = {}
+        for p in grammar.productions:
+            rules.setdefault(p.lhs, []).append(p.rule)
+        return {nterm: tuple(variants) for nterm, variants in rules.items()}
+
+    def _update(self, changed: dict[Nonterminal, tuple[RProductionRule, ...]]) -> list[Elem]:
+        affected = set()
+        for nterm, rules in changed.items():
+            if len(rules) > 0:
+                self._rules[nterm] = rules
+            else:
+                self._rules.pop(nterm, None)
+            expr = RegexEquation.expr_from_productions(ProductionCombination(nterm, list(rules)))
+            self._set_equation(RegexEquation.from_expr(expr, Elem(nterm)))
+            affected.add(Elem(nterm))
+
+        work = list(affected)
+        while work:
+            for dependent in self._dependents.get(work.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    work.append(dependent)
+        # Нетерминалы, впервые появившиеся в правых частях, получают уравнение с пустой суммой
+        affected.update(X for X in self._equations.keys() if X not in self._solutions)
+        self._resolve(affected)
+        return [X for X in self._equations.keys() if X in affected]
+
+    def _set_equation(self, eq: RegexEquation) -> None:
+        for Y in self._graph.get(eq.X, ()):
+            self._dependents[Y].discard(eq.X)
+        self._equations[eq.X] = eq
+        self._graph[eq.X] = [Y for Y in eq.beta.elems
+                             if isinstance(Y.sym, Nonterminal) and Y != eq.X and Y.sym != EPSYLON_SYMBOL]
+        for Y in self._graph[eq.X]:
+            self._dependents.setdefault(Y, set()).add(eq.X)
+            if Y not in self._equations:
+                self._set_equation(RegexEquation.from_expr(Expr('+', []), Y))
+
+    def _resolve(self, affected: set[Elem]) -> None:
+        """
+        Множество affected замкнуто по зависимым, поэтому состоит из целых компонент сильной связности;
+        решения остальных переменных берутся готовыми
+        """
+        for X in affected:
+            self._results.pop(X, None)
+        graph = {X: [Y for Y in self._graph[X] if Y in affected] for X in self._equations.keys() if X in affected}
+        for component in strongly_connected_components(graph):
+            eqs = solve_component([self._equations[X] for X in component], self._results, self.max_size)
+            for eq in eqs:
+                self._solutions[eq.X] = eq
+                self._results[eq.X] = eq.calculate_result()
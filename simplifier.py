@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import metrics
+from eq_solver import Closure, Elem, Expr, Item, fold
+from model.nterm import EPSYLON_SYMBOL
+
+EPSILON = Elem(EPSYLON_SYMBOL)
+EMPTY = Expr('+', [])
+
+# Ограничение на число проходов по дереву; каждое правило уменьшает размер выражения,
+# поэтому на практике неподвижная точка достигается за несколько проходов
+MAX_PASSES = 64
+
+
+@dataclass(frozen=True)
+class SimplificationReport:
+    size_before: int
+    size_after: int
+    passes: int
+    # Имя правила -> сколько раз оно сработало
+    rewrites: dict[str, int] = field(default_factory=dict)
+
+    def __repr__(self) -> str:
+        return (f'SimplificationReport({self.size_before} -> {self.size_after} nodes, '
+                f'{self.passes} passes, {sum(self.rewrites.values())} rewrites)')
+
+
+def is_epsilon(item: Item) -> bool:
+    return isinstance(item, Elem) and str(item.sym) == 'ε'
+
+
+def is_empty(item: Item) -> bool:
+    return item is EMPTY
+
+
+def _is_op(item: Item, sym: str) -> bool:
+    return isinstance(item, Expr) and item.op.sym == sym
+
+
+def _nullable(item: Item) -> bool:
+    """
+    Неглубокая проверка того, что язык содержит пустое слово. Может ответить False для допускающего ε выражения,
+    поэтому правила используют её только как достаточное условие
+    """
+    if isinstance(item, Closure) or is_epsilon(item):
+        return True
+    if _is_op(item, '*'):
+        return all(isinstance(arg, Closure) or is_epsilon(arg) for arg in item.args)
+    if _is_op(item, '+'):
+        return any(isinstance(arg, Closure) or is_epsilon(arg) for arg in item.args)
+    return False
+
+
+def _unwrap_single(item: Item) -> Optional[Item]:
+    """
+    (a) => a
+    """
+    if isinstance(item, Expr) and len(item.args) == 1:
+        return item.args[0]
+    return None
+
+
+def _merge_nested(item: Item) -> Optional[Item]:
+    """
+    a + (b + c) => a + b + c, a × (b × c) => a × b × c
+    """
+    if not isinstance(item, Expr) or not any(isinstance(arg, Expr) and arg.op == item.op for arg in item.args):
+        return None
+    args = []
+    for arg in item.args:
+        if isinstance(arg, Expr) and arg.op == item.op:
+            args += arg.args
+        else:
+            args.append(arg)
+    return Expr(item.op, args)
+
+
+def _product_empty(item: Item) -> Optional[Item]:
+    """
+    a × ∅ => ∅
+    """
+    if _is_op(item, '*') and any(map(is_empty, item.args)):
+        return EMPTY
+    return None
+
+
+def _product_epsilon(item: Item) -> Optional[Item]:
+    """
+    ε × a => a
+    """
+    if not _is_op(item, '*') or not any(map(is_epsilon, item.args)):
+        return None
+    args = [arg for arg in item.args if not is_epsilon(arg)]
+    if len(args) == 0:
+        return EPSILON
+    return Expr('*', args)
+
+
+def _product_closures(item: Item) -> Optional[Item]:
+    """
+    a* × a* => a*
+    """
+    if not _is_op(item, '*'):
+        return None
+    args = []
+    for arg in item.args:
+        if isinstance(arg, Closure) and len(args) > 0 and args[-1] == arg:
+            continue
+        args.append(arg)
+    if len(args) == len(item.args):
+        return None
+    return Expr('*', args)
+
+
+def _closure_trivial(item: Item) -> Optional[Item]:
+    """
+    ε* => ε, ∅* => ε
+    """
+    if isinstance(item, Closure) and (is_epsilon(item.child) or is_empty(item.child)):
+        return EPSILON
+    return None
+
+
+def _closure_of_sum(item: Item) -> Optional[Item]:
+    """
+    (ε + a)* => a*, (a + b*)* => (a + b)*
+    """
+    if not isinstance(item, Closure) or not _is_op(item.child, '+'):
+        return None
+    args = [arg.child if isinstance(arg, Closure) else arg for arg in item.child.args if not is_epsilon(arg)]
+    if args == list(item.child.args):
+        return None
+    return Closure(Expr('+', args))
+
+
+def _sum_nullable(item: Item) -> Optional[Item]:
+    """
+    ε + a* => a*: ε уже входит в язык другого слагаемого
+    """
+    if not _is_op(item, '+') or not any(map(is_epsilon, item.args)):
+        return None
+    rest = [arg for arg in item.args if not is_epsilon(arg)]
+    if not any(map(_nullable, rest)):
+        return None
+    return Expr('+', rest)
+
+
+def _sum_closure(item: Item) -> Optional[Item]:
+    """
+    a + a* => a*, ε + a × a* => a*, ε + a* × a => a*
+    """
+    if not _is_op(item, '+'):
+        return None
+    args = set(item.args)
+    absorbed = set()
+    for arg in item.args:
+        if isinstance(arg, Closure) and arg.child in args:
+            absorbed.add(arg.child)
+    if EPSILON in args:
+        for arg in item.args:
+            if _is_op(arg, '*') and len(arg.args) == 2:
+                first, second = arg.args
+                if Closure(first) == second or Closure(second) == first:
+                    absorbed.add(arg)
+                    absorbed.add(EPSILON)
+                    args.add(second if isinstance(second, Closure) else first)
+    if len(absorbed) == 0:
+        return None
+    return Expr('+', [arg for arg in list(item.args) + list(args) if arg not in absorbed])
+
+
+def _factor_prefix(item: Item) -> Optional[Item]:
+    """
+    a × b + a × c + a => a × (b + c + ε)
+    """
+    if not _is_op(item, '+'):
+        return None
+    groups: dict[Item, list[Item]] = {}
+    for arg in item.args:
+        if _is_op(arg, '*') and len(arg.args) > 0:
+            head = arg.args[0]
+            tail = arg.args[1] if len(arg.args) == 2 else Expr('*', arg.args[1:])
+        else:
+            head, tail = arg, EPSILON
+        groups.setdefault(head, []).append(tail)
+    if len(groups) == len(item.args):
+        return None
+    result = Expr('+', [Expr('*', [head, Expr('+', tails)]) if len(tails) > 1 else
+                        (head if is_epsilon(tails[0]) else Expr('*', [head, tails[0]]))
+                        for head, tails in groups.items()])
+    # a × b + a => a × (b + ε) выгодно только для составного a
+    if result.size >= item.size:
+        return None
+    return result
+
+
+# Тождества алгебры Клини, применяемые к каждому узлу до неподвижной точки.
+# Каждое правило строго уменьшает размер выражения
+RULES: tuple[tuple[str, Callable[[Item], Optional[Item]]], ...] = (
+    ('unwrap_single', _unwrap_single),
+    ('merge_nested', _merge_nested),
+    ('product_empty', _product_empty),
+    ('product_epsilon', _product_epsilon),
+    ('product_closures', _product_closures),
+    ('closure_trivial', _closure_trivial),
+    ('closure_of_sum', _closure_of_sum),
+    ('sum_nullable', _sum_nullable),
+    ('sum_closure', _sum_closure),
+    ('factor_prefix', _factor_prefix),
+)
+
+
+def simplify(item: Item,
+             rules: tuple[tuple[str, Callable[[Item], Optional[Item]]], ...] = RULES
+             ) -> tuple[Item, SimplificationReport]:
+    """
+    Переписывает выражение по таблице правил снизу вверх, пока хоть одно правило срабатывает.
+    Язык выражения не меняется, а размер (и число состояний построенного по нему автомата) уменьшается
+    """
+    rewrites: dict[str, int] = {}
+
+    def rewrite(node: Item, children: list[Item]) -> Item:
+        if isinstance(node, Closure):
+            node = Closure(children[0])
+        elif isinstance(node, Expr):
+            node = Expr(node.op, children)
+        changed = True
+        while changed:
+            changed = False
+            for name, rule in rules:
+                result = rule(node)
+                if result is not None and result != node:
+                    rewrites[name] = rewrites.get(name, 0) + 1
+                    node = result
+                    changed = True
+                    break
+        return node
+
+    size_before = item.size
+    passes = 0
+    with metrics.stage('simplify'):
+        while passes < MAX_PASSES:
+            passes += 1
+            result = fold(item, rewrite)
+            if result == item:
+                break
+            item = result
+    metrics.gauge('simplify.size_before', size_before)
+    metrics.gauge('simplify.size_after', item.size)
+    return item, SimplificationReport(size_before, item.size, passes, rewrites)
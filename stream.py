@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import codecs
+from abc import ABC, abstractmethod
+from typing import Optional, Union
+
+Chunk = Union[str, bytes, bytearray, memoryview]
+
+
+class ChunkMatcher(ABC):
+    """
+    Потоковая проверка строки по частям: feed(chunk) для каждого куска входа, finish() в конце.
+    Байтовые куски декодируются как UTF-8 инкрементально, поэтому символ может быть разрезан границей кусков.
+    Некорректный UTF-8 не принимается: feed и finish возвращают False.
+    Между кусками хранится только текущее состояние автомата
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._finished = False
+        self._invalid = False
+
+    def feed(self, chunk: Chunk) -> bool:
+        """
+        Возвращает False, если ни одно продолжение входа уже не может быть принято
+        """
+        if self._finished:
+            raise RuntimeError('Unable to feed a finished matcher')
+        if self._invalid or not self.alive:
+            return False
+        if isinstance(chunk, str):
+            if self._decoder.getstate()[0]:
+                raise ValueError('Unable to feed text while a byte chunk ended in the middle of a character')
+        else:
+            chunk = self._decode(chunk)
+            if chunk is None:
+                return False
+        self._feed_text(chunk)
+        return self.alive
+
+    def finish(self) -> bool:
+        if self._finished:
+            raise RuntimeError('Matcher is already finished')
+        self._finished = True
+        if self._invalid or not self.alive:
+            return False
+        text = self._decode(b'', final=True)
+        if text is None:
+            return False
+        self._feed_text(text)
+        return self.accepted
+
+    def _decode(self, chunk: Union[bytes, bytearray, memoryview], final: bool = False) -> Optional[str]:
+        try:
+            return self._decoder.decode(chunk, final)
+        except UnicodeDecodeError:
+            self._invalid = True
+            return None
+
+    @property
+    @abstractmethod
+    def alive(self) -> bool:
+        ...
+
+    @property
+    @abstractmethod
+    def accepted(self) -> bool:
+        ...
+
+    @abstractmethod
+    def _feed_text(self, text: str) -> None:
+        ...
@@ -0,0 +1,33 @@
+from benchmarks.generators import chain_grammar, kth_from_end_grammar, random_grammar, strongly_connected_grammar
+from benchmarks.pipeline import STAGES, Case, compare, run
+from main import fsm_from_grammar
+from model.rgrammar import RGrammar
+
+
+def test_generators():
+    assert len(RGrammar.fromstring(random_grammar(30, fan_out=3, chain_length=2, seed=1)).productions) == 90
+    assert RGrammar.fromstring(random_grammar(10, seed=1)).nterms[0].symbol == 'X0'
+    assert len(fsm_from_grammar(RGrammar.fromstring(chain_grammar(50))).states) == 52
+    assert len(RGrammar.fromstring(strongly_connected_grammar(7)).productions) == 28
+
+    s = fsm_from_grammar(RGrammar.fromstring(kth_from_end_grammar(3)))
+    assert s.apply('bbabab')[0]
+    assert not s.apply('bbbaab')[0]
+    # 2^(k+1) живых состояний и тупиковое
+    assert len(s.to_dfa().accepting) == 16 + 1
+
+
+def test_run_and_compare():
+    cases = [
+        Case('chain', chain_grammar, {'length': 10}, chain_count=5, chain_length=10),
+        Case('scc', strongly_connected_grammar, {'n_nterms': 4}, alphabet='abc', chain_count=5, chain_length=10),
+    ]
+    results = run(cases, repeat=1, memory=True, log=lambda _: None)
+    for result in results['cases'].values():
+        assert list(result['stages'].keys()) == [name for name, _ in STAGES]
+        assert all(stage['error'] is None and stage['peak_bytes'] > 0 for stage in result['stages'].values())
+    assert results['cases']['chain']['stats']['direct_fsm_states'] == 12
+
+    lines, regressed = compare(results, results)
+    assert not regressed
+    assert len(lines) == 1 + 2 * len(STAGES)
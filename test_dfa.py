@@ -0,0 +1,243 @@
+import sys
+from itertools import product
+
+from lazy_dfa import LazyDFA
+from eq_solver import Closure, Elem, Expr, literal_prefix
+from main import FSM, build_fsm, dfa_from_grammars, dfa_from_item, fsm_from_item, regex_from_grammar
+from model.rgrammar import RGrammar
+from regex_solver import RegexEquation, regex_solve
+
+
+def fsm_from_grammar_str(grammar_str: str) -> FSM:
+    grammar = RGrammar.fromstring(grammar_str)
+    solved_eqs = regex_solve(RegexEquation.expr_from_grammar(grammar))
+    interested_regex = list(filter(lambda x: x.X.sym == grammar.start, solved_eqs))[0].calculate_result()
+    return FSM('start', fsm_from_item(interested_regex))
+
+
+def all_chains(alphabet: str, max_len: int):
+    for length in range(max_len + 1):
+        for chain in product(alphabet, repeat=length):
+            yield ''.join(chain)
+
+
+def test_dfa_matches_fsm():
+    s = fsm_from_grammar_str('''
+                X1 -> 0 X2 | 1 X1 | ε
+                X2 -> 0 X3 | 1 X2
+                X3 -> 0 X1 | 1 X3
+                ''')
+    dfa = s.to_dfa()
+
+    assert dfa.table.shape == (dfa.states_count, len(dfa.symbols) + 1)
+    assert not dfa.accepting[0]
+    for chain in all_chains('01', 7):
+        assert dfa.match(chain) == s.apply(chain)[0]
+    assert not dfa.match('1x1')
+
+
+def test_minimize():
+    s = fsm_from_grammar_str('S -> a S | b S | a b b')
+    dfa = s.to_dfa(minimize=False)
+    minimized, report = dfa.minimize()
+
+    assert report.states_before == dfa.states_count
+    assert report.states_after == minimized.states_count
+    # (a|b)*abb: 4 состояния + мёртвое
+    assert minimized.states_count == 5
+    assert s.to_dfa().states_count == 5
+    for chain in all_chains('abc', 6):
+        assert minimized.match(chain) == dfa.match(chain)
+
+
+def test_match_many():
+    s = fsm_from_grammar_str('S -> a S | b S | a b b')
+    chains = list(all_chains('abx', 6)) + ['ab' * 100 + 'abb', 'ä', 'a\ud800', 'abb\udfff']
+    dfa = s.to_dfa()
+
+    result = dfa.match_many(chains, batch_size=50)
+    assert result.dtype == bool
+    assert result.tolist() == [dfa.match(chain) for chain in chains]
+    assert s.match_many([]).tolist() == []
+
+
+def test_stream_matchers():
+    s = fsm_from_grammar_str('S -> a S | b S | a b b')
+    text = 'ab' * 1000 + 'abb'
+
+    for matcher in (s.matcher(), s.to_dfa().matcher()):
+        for idx in range(0, len(text), 7):
+            assert matcher.feed(text[idx:idx + 7])
+        assert matcher.finish()
+
+    matcher = s.to_dfa().matcher()
+    data = text.encode()
+    matcher.feed(memoryview(data)[:10])
+    matcher.feed(data[10:])
+    assert matcher.finish()
+
+    matcher = s.matcher()
+    assert not matcher.feed('abc')
+    assert not matcher.finish()
+
+    for make_matcher in (s.matcher, s.to_dfa().matcher):
+        matcher = make_matcher()
+        assert matcher.feed(b'ab\xff') is False
+        assert matcher.finish() is False
+
+        matcher = make_matcher()
+        assert matcher.feed(b'ab')
+        assert matcher.feed('é'.encode()[:1])
+        assert matcher.finish() is False
+
+    matcher = s.to_dfa().matcher()
+    matcher.feed('ab'.encode() + 'é'.encode()[:1])
+    try:
+        matcher.feed('abb')
+    except ValueError:
+        pass
+    else:
+        raise RuntimeError('Text after a partial character must be rejected')
+
+    matcher = s.to_dfa().matcher()
+    matcher.feed(b'ab')
+    matcher.feed('abb')
+    assert matcher.finish() is True
+
+
+def test_lazy_dfa():
+    s = fsm_from_grammar_str('S -> a S | b S | a b b')
+    lazy = LazyDFA(s)
+    for chain in all_chains('abc', 6):
+        assert lazy.match(chain) == s.apply(chain)[0]
+    assert lazy.stats.misses <= lazy.cache_size * 3
+    assert lazy.stats.hits > 0
+    assert lazy.stats.flushes == 0
+
+    tiny = LazyDFA(s, max_states=2, max_flushes=1)
+    assert tiny.match('ab' * 100 + 'abb')
+    assert not tiny.match('ab' * 100 + 'ab')
+    assert tiny.stats.fallbacks > 0
+    assert tiny.cache_size <= 2
+
+
+def test_compact_fsm():
+    s = fsm_from_grammar_str('S -> a S | b S | a b b')
+    compact = s.compact()
+
+    assert compact.states_count == len(s.states)
+    assert compact.state_name(compact.start_state) == 'start'
+    assert sum(1 for state in range(compact.states_count) for _ in compact.ribs(state)) == compact.ribs_count
+    dfa = compact.to_dfa()
+    assert compact.to_dfa() is dfa
+    for chain in all_chains('abc', 6):
+        assert compact.match(chain) == s.apply(chain)[0]
+        assert dfa.match(chain) == s.to_dfa().match(chain)
+
+    # Структура FSM без таблицы имён: словарь состояний, объекты состояний, списки и объекты рёбер
+    fsm_bytes = sys.getsizeof(s.states)
+    for state in s.states.values():
+        fsm_bytes += sys.getsizeof(state) + sys.getsizeof(state.__dict__) + sys.getsizeof(state.ribs)
+        fsm_bytes += sum(sys.getsizeof(rib) + sys.getsizeof(rib.__dict__) for rib in state.ribs)
+    assert compact.nbytes * 10 < fsm_bytes
+
+    try:
+        compact.start_state = 0
+    except AttributeError:
+        pass
+    else:
+        raise RuntimeError('CompactFSM must be immutable')
+
+
+def test_search():
+    regex = Expr('*', ['x', 'y', Closure(Elem('z')), 'q'])
+    assert literal_prefix(regex) == 'xy'
+    dfa = dfa_from_item(regex)
+    assert dfa.prefix == 'xy'
+
+    text = 'xyq..xyzzq.xy.xyzq'
+    assert list(dfa.finditer(text)) == [(0, 3), (5, 10), (14, 18)]
+    assert list(dfa.finditer(text.encode())) == [(0, 3), (5, 10), (14, 18)]
+    assert dfa.search(text, 1) == (5, 10)
+    assert dfa.count(text) == 3
+    assert dfa.search('xy') is None
+
+    # Без исходного выражения префикс выводится из самого автомата
+    fsm = FSM('start', fsm_from_item(regex))
+    assert fsm.to_dfa().prefix == 'xy'
+    assert fsm.compact().to_dfa().prefix == 'xy'
+    assert list(fsm.to_dfa().finditer(text)) == [(0, 3), (5, 10), (14, 18)]
+
+    # Самое левое, затем самое длинное
+    dfa = fsm_from_grammar_str('S -> a S | b S | a b b').to_dfa()
+    assert list(dfa.finditer('cababbabbc')) == [(1, 9)]
+    dfa = dfa_from_item(Closure(Elem('a')))
+    assert list(dfa.finditer('baab')) == [(0, 0), (1, 3), (3, 3), (4, 4)]
+
+
+def test_union_dfa():
+    grammars = [
+        RGrammar.fromstring('S -> a S | b S | a b b'),
+        RGrammar.fromstring('S -> a S | a'),
+        RGrammar.fromstring('S -> b S | b'),
+        RGrammar.fromstring('S -> a b b'),
+    ]
+    fsms = [FSM('start', fsm_from_item(regex_from_grammar(grammar))) for grammar in grammars]
+    dfa = dfa_from_grammars(grammars)
+
+    chains = list(all_chains('abc', 5))
+    for chain in chains:
+        expected = frozenset(idx for idx, fsm in enumerate(fsms) if fsm.apply(chain)[0])
+        assert dfa.match_ids(chain) == expected
+        assert dfa.match(chain) == (len(expected) > 0)
+    assert dfa.match_ids_many(chains) == list(map(dfa.match_ids, chains))
+    assert dfa.match_ids('abb') == frozenset([0, 3])
+
+
+def test_deep_item_fsm():
+    item = Elem('a')
+    for _ in range(300):
+        item = Expr('*', ['b', Expr('+', [item, 'c'])])
+    fsm = FSM('start', fsm_from_item(item))
+    assert fsm.apply('b' * 300 + 'a')[0]
+    assert fsm.apply('bbc')[0]
+    assert not fsm.apply('bbba')[0]
+
+
+def test_empty_language():
+    empty = Expr('*', ['a', Expr('+', [])]).flatten(distribute=False)
+    fsm = FSM('start', fsm_from_item(empty))
+    assert not fsm.apply('')[0]
+    assert not fsm.apply('a')[0]
+    assert not fsm.to_dfa().match('')
+
+    fsm = FSM('start', fsm_from_item(Expr('*', ['a', Closure(Expr('+', []))])))
+    assert fsm.apply('a')[0]
+    assert not fsm.apply('')[0]
+    assert not fsm.apply('aa')[0]
+
+
+def test_glushkov():
+    for grammar_str in ('S -> a S | b S | a b b',
+                        'S -> a A | ε\nA -> b S | c A',
+                        'S -> a S | b'):
+        regex = regex_from_grammar(RGrammar.fromstring(grammar_str))
+        thompson = build_fsm(regex)
+        glushkov = build_fsm(regex, method='glushkov')
+        assert all(rib.symbol is not None for state in glushkov.states.values() for rib in state.ribs)
+        assert len(glushkov.states) < len(thompson.states)
+        for chain in all_chains('abc', 6):
+            assert glushkov.apply(chain)[0] == thompson.apply(chain)[0]
+            assert glushkov.to_dfa().match(chain) == thompson.apply(chain)[0]
+
+    # Начальное состояние конечно, если язык содержит пустое слово
+    fsm = build_fsm(Closure(Elem('a')), method='glushkov')
+    assert fsm.final_states == {'start', '1.a'}
+    assert fsm.apply('')[0] and fsm.apply('aaa')[0]
+
+    try:
+        build_fsm(Elem('a'), method='brzozowski')
+    except ValueError:
+        pass
+    else:
+        raise RuntimeError('Unknown construction method must be rejected')
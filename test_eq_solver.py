@@ -1,4 +1,4 @@
-from eq_solver import Op, Expr, Elem
+from eq_solver import Op, Expr, Elem, Closure, ExpressionSizeError, deserialize, normalization_stats, serialize, shared_size
 
 
 def gen_complicated_eq(op: Op, depth: int = 5, layer_size: int = 10) -> Expr:
@@ -213,3 +213,145 @@ def test_extract_multiple_eq():
         assert extr1.extract(Elem('X'))[0] == Expr('*', [Elem('been')])
     else:
         raise RuntimeError('Sun was exploded')
+
+
+def test_interning():
+    assert Elem('a') is Elem('a')
+    assert Expr('+', ['a', 'b']) is Expr('+', [Elem('b'), Elem('a')])
+    assert Expr('+', ['a', 'a', Expr('*', ['a', 'b']), Expr('*', ['a', 'b'])]).args == (
+        Elem('a'), Expr('*', ['a', 'b']))
+    assert Expr('*', ['a', 'b']) is not Expr('*', ['b', 'a'])
+    assert Closure(Closure(Expr('+', ['a']))) is Closure(Elem('a'))
+
+    exprs = {Expr('*', ['a', Closure(Elem('b'))]), Expr('*', ['a', Closure(Elem('b'))])}
+    assert len(exprs) == 1
+
+    try:
+        Elem('a').sym = 'b'
+    except AttributeError:
+        pass
+    else:
+        raise RuntimeError('Expression nodes must be immutable')
+
+
+def test_flatten_keeps_mul_order():
+    eq = Expr('*', [Expr('+', ['a', 'b']), 'c', Expr('+', ['d', 'e'])])
+    assert eq.flatten() == Expr(
+        '+',
+        [
+            Expr('*', ['a', 'c', 'd']),
+            Expr('*', ['a', 'c', 'e']),
+            Expr('*', ['b', 'c', 'd']),
+            Expr('*', ['b', 'c', 'e']),
+        ]
+    )
+
+
+def test_flatten_factored():
+    sums = [Expr('+', [f'a{i}', f'b{i}']) for i in range(20)]
+    eq = Expr('*', sums)
+
+    factored = eq.flatten(distribute=False)
+    assert factored == eq
+    assert factored.size == 61
+
+    try:
+        eq.flatten(budget=10_000)
+    except ExpressionSizeError:
+        pass
+    else:
+        raise RuntimeError('Distribution over the budget must fail')
+
+    assert Expr('*', ['a', Expr('+', [])]).flatten(distribute=False) == Expr('+', [])
+
+
+def test_expand():
+    eq = Expr('*', ['a', Expr('+', [Expr('*', ['b', 'X']), Expr('*', ['c', Expr('+', ['d', 'e'])])])])
+    assert eq.expand(Elem('X')) == Expr(
+        '+',
+        [
+            Expr('*', ['a', 'b', 'X']),
+            Expr('*', ['a', Expr('*', ['c', Expr('+', ['d', 'e'])])]).flatten(distribute=False),
+        ]
+    )
+
+
+def test_normalization_cache():
+    eq = Expr('*', [Expr('+', ['a', Expr('*', ['b', Expr('*', ['c', 'd'])])]), Closure(Expr('+', ['e', 'f']))])
+
+    normalization_stats.reset()
+    flat = eq.flatten(distribute=False)
+    misses = normalization_stats.misses
+    assert misses > 0
+
+    assert eq.flatten(distribute=False) is flat
+    assert flat.flatten(distribute=False) is flat
+    assert normalization_stats.misses == misses
+    assert normalization_stats.hits >= 2
+
+
+def test_normalization_cache_history():
+    # unfold_singles не идемпотентна: кэш не должен считать её результат уже нормализованным
+    eq = Expr('*', [Expr('+', [Expr('+', []), 'b']), Closure(Elem('X'))])
+    once = eq.unfold_singles()
+    assert once == Expr('+', [Expr('*', ['b', Closure(Elem('X'))])])
+    assert once.unfold_singles() == Expr('*', ['b', Closure(Elem('X'))])
+
+    Expr('+', [Expr('*', [Expr('*', [Expr('*', ['X'])])]), Expr('*', ['a'])]).unfold_singles()
+    assert Expr('+', [Expr('*', ['X']), 'a']).unfold_singles() == Expr('+', ['X', 'a'])
+
+
+def test_deep_expression():
+    eq = Elem('a')
+    for _ in range(5000):
+        eq = Expr('*', ['b', Expr('+', [eq, 'c'])])
+
+    assert eq.depth() == 10000
+    assert eq.has_item(Elem('a'))
+    assert not eq.has_item(Elem('d'))
+    assert eq.replace(Elem('a'), Elem('d')).has_item(Elem('d'))
+    assert eq.flatten(distribute=False).size == eq.size
+    assert repr(eq).startswith('b × (')
+
+    X = Elem('X')
+    beta, extracted = Expr('+', [Expr('*', ['a', X]), eq, Expr('*', [eq, X])]).expand(X).extract(X)
+    assert beta.args == (eq.flatten(distribute=False),)
+    assert len(extracted) == 2
+
+
+def test_sum_canonical_order():
+    first = Expr('+', ['q', Expr('*', ['p', 'r']), 'o'])
+    assert repr(first) == 'o + (p × r) + q'
+    assert repr(Expr('+', ['o', 'q', Expr('*', ['p', 'r'])])) == repr(first)
+
+
+def test_shared_size():
+    eq = Elem('a')
+    for _ in range(40):
+        eq = Expr('*', [eq, eq])
+    assert eq.size == 2 ** 41 - 1
+    assert shared_size(eq) == 41
+
+
+def test_elems():
+    a_star = Closure(Elem('a'))
+    eq = Expr('*', [Expr('+', ['b', 'c']), a_star, 'X'])
+    assert eq.elems == frozenset(map(Elem, 'abcX'))
+    assert eq.has_item(Elem('a'))
+    assert eq.has_item(a_star)
+    assert not eq.has_item(Elem('d'))
+    # Множество листьев переиспользуется, если новых листьев нет
+    assert Expr('+', [eq, 'b']).elems is eq.elems
+    assert a_star.elems is Elem('a').elems
+
+
+def test_serialize():
+    shared = Expr('+', ['a', Closure(Expr('*', ['b', 'c']))])
+    deep = Elem('x')
+    for i in range(5000):
+        deep = Expr('*', [Elem('a'), Closure(deep)]) if i % 2 else Expr('+', [deep, Elem('b')])
+    items = [Expr('*', [shared, shared, 'd']), shared, deep]
+
+    table, roots = serialize(items)
+    assert deserialize(table, roots) == items
+    assert len(table) == shared_size(Expr('*', items)) - 1
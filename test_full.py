@@ -1,6 +1,10 @@
-from main import FSM, fsm_from_item
+import sys
+
+from main import FSM, build_fsm, fsm_from_grammar, fsm_from_item, regex_from_grammar
+from model.nterm import Nonterminal
 from model.rgrammar import RGrammar
-from regex_solver import RegexEquation, regex_solve
+from model.rproduction import RProductionRule
+from regex_solver import RegexEquation, SolverSession, dependency_graph, regex_solve, strongly_connected_components
 
 
 def test_basic():
@@ -39,3 +43,135 @@ def test_basic():
         r, _, _ = s.apply(text)
         assert result == r
 
+
+def test_tracing():
+    grammar = RGrammar.fromstring('S -> a S | b S | a b b')
+    solved_eqs = regex_solve(RegexEquation.expr_from_grammar(grammar))
+    interested_regex = list(filter(lambda x: x.X.sym == grammar.start, solved_eqs))[0].calculate_result()
+    s = FSM('start', fsm_from_item(interested_regex))
+
+    assert s.apply('babb') == (True, s.apply('babb', tracing=True)[1], None)
+
+    r, state, trace = s.apply('babb', tracing=True)
+    assert r
+    assert trace.items[0] == 'start'
+    assert trace.last == state.name
+    for name, next_name in zip(trace.items, trace.items[1:]):
+        assert any(rib.state_name == next_name for rib in s.state_by_name(name).ribs)
+    assert [s.state_by_name(name).ribs[0].symbol for name in trace.items[:-1]
+            if s.state_by_name(name).ribs[0].symbol is not None] == list('babb')
+
+    r, _, trace = s.apply('ab' * 5000, tracing=True)
+    assert not r
+    assert trace.items == ['start']
+
+
+def test_apply_long_input():
+    grammar = RGrammar.fromstring('S -> a S | b S | a b b')
+    solved_eqs = regex_solve(RegexEquation.expr_from_grammar(grammar))
+    interested_regex = list(filter(lambda x: x.X.sym == grammar.start, solved_eqs))[0].calculate_result()
+    s = FSM('start', fsm_from_item(interested_regex))
+
+    # Неоднозначная грамматика: перебор с возвратами экспоненциален по длине входа
+    chain = 'ab' * (sys.getrecursionlimit() * 5)
+    assert s.apply(chain + 'abb')[0]
+    assert not s.apply(chain + 'ab')[0]
+    assert not s.apply('a' * 30 + 'c')[0]
+
+
+def test_solve_large_grammar():
+    lines = [f'X{i} -> a X{i + 1} | b' for i in range(300)] + ['X300 -> c']
+    grammar = RGrammar.fromstring('\n'.join(lines))
+    s = build_fsm(regex_from_grammar(grammar), method='glushkov')
+    assert s.apply('a' * 300 + 'c')[0]
+    assert s.apply('a' * 150 + 'b')[0]
+    assert not s.apply('a' * 299 + 'c')[0]
+
+    # Одна компонента сильной связности из 20 нетерминалов
+    lines = [f'X{i} -> a X{(i + 1) % 20} | b X{(i * 7) % 20} | c X{(i * 3 + 1) % 20} | c' for i in range(20)]
+    grammar = RGrammar.fromstring('\n'.join(lines))
+    eqs = RegexEquation.expr_from_grammar(grammar)
+    assert len(strongly_connected_components(dependency_graph(eqs))) == 1
+    variables = {eq.X for eq in eqs}
+    for eq in regex_solve(eqs):
+        assert not (eq.beta.elems & variables)
+        assert not (eq.alpha.elems & variables)
+
+
+def test_dependency_order():
+    grammar = RGrammar.fromstring('''
+        S -> a A | b B
+        A -> a A | c C
+        B -> b S | c
+        C -> c
+    ''')
+    components = strongly_connected_components(dependency_graph(RegexEquation.expr_from_grammar(grammar)))
+    names = [sorted(str(X) for X in component) for component in components]
+    assert names == [['C'], ['A'], ['B', 'S']]
+
+
+def test_solver_session():
+    grammar = RGrammar.fromstring('''
+        S -> a A | b B
+        A -> a A | c C
+        B -> b S | c
+        C -> c
+        D -> d
+    ''')
+    session = SolverSession(grammar)
+    untouched = session.solution(Nonterminal('D'))
+
+    # От C зависят A, S и B, но не D
+    resolved = session.update(Nonterminal('C'), [RProductionRule(('d',), None), RProductionRule(('c',), Nonterminal('C'))])
+    assert sorted(str(X) for X in resolved) == ['A', 'B', 'C', 'S']
+    assert session.solution(Nonterminal('D')) is untouched
+
+    edited = RGrammar.fromstring('''
+        S -> a A | b B
+        A -> a A | c C
+        B -> b S | c | E
+        C -> d | c C
+        D -> d
+        E -> e
+    ''')
+    resolved = session.update_grammar(edited)
+    assert sorted(str(X) for X in resolved) == ['B', 'E', 'S']
+    assert session.update_grammar(edited) == []
+
+    for eq in regex_solve(RegexEquation.expr_from_grammar(edited)):
+        s = FSM('start', fsm_from_item(eq.calculate_result()))
+        t = FSM('start', fsm_from_item(session.solution(eq.X.sym)))
+        for text in ['', 'c', 'd', 'e', 'acd', 'accd', 'bc', 'be', 'bbacd', 'bbbc', 'ac']:
+            assert s.apply(text)[0] == t.apply(text)[0]
+
+
+def test_parallel_solve():
+    lines = ['S -> a A0 | b B0 | c']
+    lines += [f'A{i} -> a A{(i + 1) % 4} | b A{(i * 3) % 4} | c C' for i in range(4)]
+    lines += [f'B{i} -> b B{(i + 1) % 4} | a C | ε' for i in range(4)]
+    lines += ['C -> c C | d']
+    eqs = RegexEquation.expr_from_grammar(RGrammar.fromstring('\n'.join(lines)))
+    assert regex_solve(eqs, workers=2) == regex_solve(eqs)
+
+
+def test_fsm_from_grammar():
+    grammar = RGrammar.fromstring('''
+        S -> a S | b S | a b b | A
+        A -> c B | ε
+        B -> d
+        C -> c
+    ''')
+    direct = fsm_from_grammar(grammar)
+    s = FSM('start', fsm_from_item(regex_from_grammar(grammar)))
+    for text in ['', 'abb', 'babb', 'ab', 'cd', 'abcd', 'c', 'abbcd', 'ababb', 'd']:
+        assert direct.apply(text)[0] == s.apply(text)[0]
+        assert direct.to_dfa().match(text) == s.apply(text)[0]
+
+    # Нетерминал без продукций -- пустой язык
+    assert not fsm_from_grammar(RGrammar.fromstring('S -> a A')).apply('a')[0]
+
+    lines = [f'X{i} -> a X{i + 1} | b X{(i * 7) % 5000} | c' for i in range(5000)]
+    direct = fsm_from_grammar(RGrammar.fromstring('\n'.join(lines)))
+    assert len(direct.states) == 5002
+    assert direct.apply('a' * 4999 + 'bc')[0]
+    assert not direct.apply('a' * 100 + 'd')[0]
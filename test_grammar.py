@@ -0,0 +1,99 @@
+import io
+import mmap
+
+import pytest
+
+from model.nterm import Nonterminal
+from model.parser import GrammarSyntaxError, SymbolTable, iter_productions
+from model.rgrammar import RGrammar
+from model.rproduction import RProduction
+
+
+def test_fromstring():
+    text = '''
+        S -> a S | b A c B | ε
+
+        A -> α | a b
+        B -> b
+    '''
+    grammar = RGrammar.fromstring(text)
+    expected = []
+    for line in text.split('\n'):
+        if line.strip():
+            expected += RProduction.from_string(line.strip())
+    assert grammar.productions == expected
+    assert grammar.start == Nonterminal('S')
+    assert [p.rule.nterm for p in grammar.productions[:3]] == [Nonterminal('S'), Nonterminal('B'), Nonterminal('ε')]
+    assert grammar.productions[1].rule.terms == ('b', Nonterminal('A'), 'c')
+
+    assert RGrammar.fromstring('').productions == RProduction.from_string('S -> ε')
+
+
+def test_symbol_table():
+    symbols = SymbolTable()
+    productions = list(iter_productions(['S -> a S | a A', 'A -> a S'], symbols))
+    assert len(symbols) == 3
+    assert productions[1].rule.nterm is productions[2].lhs
+    assert productions[0].rule.terms[0] is productions[1].rule.terms[0]
+
+
+@pytest.mark.parametrize('text, line, column', [
+    ('S -> a\nA a', 2, 1),
+    ('S -> a -> b', 1, 8),
+    ('S -> a\n  -> b', 2, 3),
+    ('S -> a |  | b', 1, 11),
+    ('S -> a\n\nA -> b |', 3, 9),
+])
+def test_syntax_errors(text, line, column):
+    with pytest.raises(GrammarSyntaxError) as error:
+        RGrammar.fromstring(text)
+    assert (error.value.line, error.value.column) == (line, column)
+    assert isinstance(error.value, ValueError)
+
+
+GRAMMAR = '''S -> a S | b A
+A -> α B | c | ε
+
+B -> b S
+'''
+
+
+def test_from_file(tmp_path):
+    expected = RGrammar.fromstring(GRAMMAR)
+    path = tmp_path / 'grammar.txt'
+    path.write_text(GRAMMAR.replace('\n', '\r\n'), encoding='utf-8')
+
+    assert RGrammar.from_file(path) == expected
+    assert RGrammar.from_file(str(path)) == expected
+    with open(path, 'rb') as f:
+        assert RGrammar.from_file(f) == expected
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            assert RGrammar.from_file(m) == expected
+            assert list(RGrammar.iter_productions(m)) == []
+    assert RGrammar.from_file(io.StringIO(GRAMMAR)) == expected
+    assert RGrammar.from_file(io.StringIO('')).productions == RProduction.from_string('S -> ε')
+
+    grammar = RGrammar.from_file(io.StringIO(GRAMMAR))
+    assert grammar.nterms == [Nonterminal('S'), Nonterminal('A'), Nonterminal('B'), Nonterminal('ε')]
+    assert grammar.productions_by_lhs(Nonterminal('A')).rhs_variants == \
+        [p.rule for p in expected.productions if p.lhs == Nonterminal('A')]
+    assert grammar.productions_by_lhs(Nonterminal('C')).rhs_variants == []
+
+
+def test_iter_productions_is_lazy():
+    def lines():
+        yield 'S -> a S | b'
+        raise AssertionError('read past the first line')
+
+    productions = RGrammar.iter_productions(lines())
+    assert next(productions).lhs == Nonterminal('S')
+    assert next(productions).rule.terms == ('b',)
+
+
+def test_from_file_errors():
+    with pytest.raises(GrammarSyntaxError) as error:
+        RGrammar.from_file(io.BytesIO('S -> a\nA -> \xe9'.encode('latin-1')))
+    assert (error.value.line, error.value.column) == (2, 6)
+    with pytest.raises(GrammarSyntaxError) as error:
+        RGrammar.from_file(io.StringIO('S -> a\nA -> | b'))
+    assert (error.value.line, error.value.column) == (2, 6)
@@ -0,0 +1,67 @@
+import json
+
+import metrics
+from main import build_fsm, fsm_from_grammar, regex_from_grammar
+from model.rgrammar import RGrammar
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def on_stage(self, name, seconds):
+        self.events.append(('stage', name))
+
+    def on_count(self, name, value):
+        self.events.append(('count', name))
+
+    def on_gauge(self, name, value):
+        self.events.append(('gauge', name))
+
+
+def test_instrument():
+    recorder = Recorder()
+    with metrics.instrument(recorder) as collected:
+        grammar = RGrammar.fromstring('''
+            S -> a S | b A
+            A -> a A | b S | ε
+        ''')
+        s = build_fsm(regex_from_grammar(grammar))
+        assert s.apply('aba')[0]
+        assert not s.apply('abba')[0]
+        dfa = fsm_from_grammar(grammar).to_dfa()
+        assert not dfa.match('bb')
+        dfa.match_many(['ab', 'b'])
+
+    assert {'parse', 'expr_from_grammar', 'regex_solve', 'simplify', 'fsm_from_item', 'fsm_from_grammar'} <= \
+        set(collected.stages.keys())
+    assert collected.stages['regex_solve'].calls == 1
+    counters = collected.counters
+    assert counters['solve.components'] == 1
+    assert counters['solve.substitutions'] > 0
+    assert counters['flatten.calls'] > 0
+    assert counters['flatten.nodes_before'] > 0 and counters['flatten.nodes_after'] > 0
+    assert counters['fsm.match.calls'] == 2
+    assert counters['fsm.match.steps'] == 3 + 4
+    assert counters['dfa.match.calls'] == 3
+    assert counters['dfa.match.steps'] == 2 + 3
+    # Последний построенный автомат -- fsm_from_grammar: S, A и end
+    assert collected.gauges['fsm.states'] == 3
+    assert collected.gauges['fsm.ribs'] > 0
+
+    assert json.loads(collected.to_json()) == collected.as_dict()
+    assert len(recorder.events) > 0 and ('stage', 'regex_solve') in recorder.events
+
+
+def test_disabled():
+    assert not metrics.enabled()
+    with metrics.instrument() as outer:
+        with metrics.instrument() as inner:
+            RGrammar.fromstring('S -> a')
+        RGrammar.fromstring('S -> b')
+    assert inner.stages['parse'].calls == 1
+    assert outer.stages['parse'].calls == 1
+    assert not metrics.enabled()
+
+    RGrammar.fromstring('S -> a')
+    assert outer.stages['parse'].calls == 1
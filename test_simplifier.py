@@ -0,0 +1,43 @@
+from eq_solver import Closure, Elem, Expr
+from main import FSM, fsm_from_item, regex_from_grammar
+from model.nterm import EPSYLON_SYMBOL
+from model.rgrammar import RGrammar
+from simplifier import simplify
+from test_dfa import all_chains
+
+EPS = Elem(EPSYLON_SYMBOL)
+
+
+def test_rules():
+    a, b, c = Elem('a'), Elem('b'), Elem('c')
+    assert simplify(Expr('*', [EPS, a, EPS]))[0] == a
+    assert simplify(Expr('*', [Closure(a), Closure(a), b]))[0] == Expr('*', [Closure(a), b])
+    assert simplify(Closure(Expr('+', [EPS, a])))[0] == Closure(a)
+    assert simplify(Closure(Expr('+', [a, Closure(b)])))[0] == Closure(Expr('+', [a, b]))
+    assert simplify(Expr('+', [EPS, Expr('*', [a, Closure(a)])]))[0] == Closure(a)
+    assert simplify(Expr('+', [a, Closure(a)]))[0] == Closure(a)
+    assert simplify(Expr('*', [a, Closure(Expr('+', []))]))[0] == a
+    assert simplify(Expr('+', [Expr('*', [a, b]), Expr('*', [a, c])]))[0] == Expr('*', [a, Expr('+', [b, c])])
+
+    eq = Expr('*', [EPS, Expr('+', [Expr('*', [a, b]), Expr('*', [a, c])])])
+    item, report = simplify(eq)
+    assert report.size_before == eq.size
+    assert report.size_after == item.size < eq.size
+    assert report.rewrites['factor_prefix'] == 1
+
+
+def test_same_language():
+    grammar = RGrammar.fromstring('''
+        S -> a A | b S | ε
+        A -> a B | b S | c A
+        B -> a S | b B | c B | ε
+    ''')
+    regex = regex_from_grammar(grammar, simplified=False)
+    simplified, report = simplify(regex)
+    assert report.size_after < report.size_before
+    before = FSM('start', fsm_from_item(regex))
+    after = FSM('start', fsm_from_item(simplified))
+    assert len(after.states) < len(before.states)
+    for chain in all_chains('abc', 6):
+        assert before.apply(chain)[0] == after.apply(chain)[0]
+    assert regex_from_grammar(grammar) == simplified